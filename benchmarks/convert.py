@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Measures the conversions between all the formats on synthetic meshes
+
+For each size, a grid mesh with about this number of faces and with vertex
+colors is written in every format. Then every input is converted to every
+output with tools.convert, each conversion in a new Python process, and the
+wall time, the throughput and the peak resident set size of the process are
+reported as JSON.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from memory import ROOT, peak_rss
+
+sys.path.insert(0, ROOT)
+
+import d3.model.tools as mt
+from d3.model.basemodel import ModelParser
+from d3.model.arrays import np, FLOAT_DTYPE, INDEX_DTYPE
+
+FORMATS = {
+    'obj': ('obj', {}),
+    'ply': ('ply', {'format': 'ascii'}),
+    'ply-binary': ('ply', {'format': 'binary_little_endian'}),
+    'off': ('off', {}),
+    'stl': ('stl', {'format': 'ascii'}),
+    'stl-binary': ('stl', {'format': 'binary'}),
+}
+"""Formats of the benchmark, with their extension and exporter options
+"""
+
+def grid_mesh(faces):
+    """Returns a model of a square grid with at least a number of triangles
+
+    The grid is a height field with colors, so that no vertex is repeated.
+
+    :param faces: minimum number of triangles
+    """
+    side = int(np.ceil(np.sqrt(faces / 2))) + 1
+    (x, y) = np.meshgrid(np.linspace(0, 1, side), np.linspace(0, 1, side))
+    z = 0.1 * np.sin(8 * x) * np.cos(8 * y)
+
+    model = ModelParser()
+    model.set_array('vertices', np.column_stack([x.ravel(), y.ravel(), z.ravel()]).astype(FLOAT_DTYPE))
+    model.set_array('colors', np.column_stack([x.ravel(), y.ravel(), z.ravel() + 0.5]).astype(FLOAT_DTYPE))
+
+    corners = (np.arange(side - 1)[:, np.newaxis] * side + np.arange(side - 1)).ravel()
+    lower = np.column_stack([corners, corners + 1, corners + side])
+    upper = np.column_stack([corners + 1, corners + side + 1, corners + side])
+    model.add_face_array(np.concatenate([lower, upper]).astype(INDEX_DTYPE))
+
+    return model
+
+def input_path(directory, faces, format):
+    """Returns the path of the synthetic mesh of a size in a format
+    """
+    (extension, options) = FORMATS[format]
+    return os.path.join(directory, 'mesh-{}-{}.{}'.format(faces, format, extension))
+
+def write_inputs(directory, faces, formats):
+    """Writes the synthetic mesh of a size in all the formats
+
+    Returns the actual number of faces of the mesh.
+    """
+    model = grid_mesh(faces)
+
+    for format in formats:
+        path = input_path(directory, faces, format)
+        model.path = path
+        with open(path, 'wb') as f:
+            mt.export_model(model, path, **FORMATS[format][1]).write(f)
+
+    return model.face_count()
+
+def convert(input, output, options):
+    """Converts a model in the current process and prints the time and memory
+
+    :param input: path of the input
+    :param output: path of the output
+    :param options: JSON of the options of the exporter
+    """
+    start = time.perf_counter()
+    mt.convert(input, output, **json.loads(options))
+    print('{} {}'.format(time.perf_counter() - start, peak_rss()))
+
+def main(args):
+    directory = args.work_dir or tempfile.mkdtemp(prefix='benchmark-')
+    os.makedirs(directory, exist_ok=True)
+    results = []
+
+    try:
+        for faces in args.sizes:
+            actual = write_inputs(directory, faces, args.inputs)
+
+            for input_format in args.inputs:
+                input = input_path(directory, faces, input_format)
+
+                for output_format in args.outputs:
+                    (extension, options) = FORMATS[output_format]
+                    output = os.path.join(directory, 'output.' + extension)
+
+                    # The .stl exporter needs the whole model
+                    if args.stream and extension == 'stl':
+                        continue
+                    if args.stream:
+                        options = dict(options, stream=True)
+
+                    command = [sys.executable, __file__, '--child', input, output, json.dumps(options)]
+                    (seconds, peak) = map(float, subprocess.check_output(command).split())
+
+                    results.append({
+                        'faces': actual,
+                        'input': input_format,
+                        'output': output_format,
+                        'stream': args.stream,
+                        'seconds': seconds,
+                        'faces_per_second': actual / seconds,
+                        'input_bytes': os.path.getsize(input),
+                        'output_bytes': os.path.getsize(output),
+                        'input_megabytes_per_second': os.path.getsize(input) / seconds / (1 << 20),
+                        'peak_rss_megabytes': peak,
+                    })
+                    print('{:>9} faces  {:<10} -> {:<10} {:8.3f}s {:8.1f} MB'.format(
+                        actual, input_format, output_format, seconds, peak), file=sys.stderr)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(directory)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', metavar='faces', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='Numbers of faces of the meshes, e.g. 10000000 for a 10M faces mesh')
+    parser.add_argument('--inputs', nargs='+', choices=list(FORMATS), default=list(FORMATS),
+                        help='Formats of the inputs')
+    parser.add_argument('--outputs', nargs='+', choices=list(FORMATS), default=list(FORMATS),
+                        help='Formats of the outputs')
+    parser.add_argument('--stream', action='store_true',
+                        help='Convert the models piece by piece, except to .stl files')
+    parser.add_argument('--work-dir', metavar='directory',
+                        help='Directory where the meshes are written and kept, a temporary one by default')
+    parser.add_argument('-o', '--output', metavar='output',
+                        help='JSON file of the results, the standard output by default')
+    parser.add_argument('--child', nargs=3, metavar=('input', 'output', 'options'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        convert(*args.child)
+    else:
+        main(args)
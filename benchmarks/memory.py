@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Measures the peak memory used to load a model
+
+Each measure runs in a new Python process, and reports the peak resident set
+size of the process after importing the modules and after loading the model:
+
+- arrays: load_model, which keeps the arrays built by the parsers
+- objects: load_model, then the lists of Vector, Face and FaceVertex
+- lines: the line by line parser, which builds the objects while parsing
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ['arrays', 'objects', 'lines']
+
+def peak_rss():
+    """Returns the peak resident set size of the current process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+def load(mode, path):
+    """Loads a model in the current process and prints the peak memory
+
+    :param mode: arrays, objects or lines
+    :param path: path to the model to load
+    """
+    sys.path.insert(0, ROOT)
+    import d3.model.tools as mt
+    from d3.model.basemodel import TextModelParser
+
+    imported = peak_rss()
+
+    if mode == 'lines':
+        parser = mt.find_type(path, sniff=True).create_parser()
+        TextModelParser.parse_file(parser, path)
+    else:
+        model = mt.load_model(path)
+        if mode == 'objects':
+            lists = [model.vertices, model.colors, model.normals, model.tex_coords]
+            faces = [part.faces for part in model.parts]
+
+    print('{:.1f} {:.1f}'.format(imported, peak_rss()))
+
+def main(args):
+    print('{:<8} {:>12} {:>12} {:>12}'.format('mode', 'imports (MB)', 'peak (MB)', 'model (MB)'))
+
+    for mode in args.modes:
+        output = subprocess.check_output([sys.executable, __file__, '--child', mode, args.model])
+        (imported, peak) = map(float, output.split())
+        print('{:<8} {:>12.1f} {:>12.1f} {:>12.1f}'.format(mode, imported, peak, peak - imported))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('model', nargs='?', default=os.path.join(ROOT, 'sample.obj'),
+                        help='Model to load, sample.obj by default')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES,
+                        help='What to measure')
+    parser.add_argument('--child', choices=MODES,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        load(args.child, args.model)
+    else:
+        main(args)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Measures the startup time of the converter
+
+Each measure runs in a new Python process, several times, and the minimum and
+the median times are reported:
+
+- import: import d3.model.tools, with the modules it imports
+- convert: run convert.py on a small model, from the start of the process
+  to its end
+
+The modules of the formats and PIL are only imported when they are used, so
+the import measure also lists the ones that were imported.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from memory import ROOT
+
+TINY_OBJ = 'v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n'
+
+def imports():
+    """Imports the converter in the current process and prints the time it took
+    and the optional modules that were imported
+    """
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    import d3.model.tools
+    seconds = time.perf_counter() - start
+
+    optional = [name for name in sys.modules if name.startswith('d3.model.formats.') or name.split('.')[0] == 'PIL']
+    print(seconds, ','.join(sorted(optional)))
+
+def measure(mode, directory):
+    """Returns the time of a measure, and the optional modules imported by the
+    import measure
+
+    :param mode: import or convert
+    :param directory: directory of the small model and of its conversion
+    """
+    if mode == 'import':
+        output = subprocess.check_output([sys.executable, __file__, '--child']).decode().split(' ')
+        return (float(output[0]), output[1].strip())
+
+    input = os.path.join(directory, 'tiny.obj')
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, os.path.join(ROOT, 'convert.py'), '-i', input,
+                           '-o', os.path.join(directory, 'tiny.ply'), '--rgb-only'])
+    return (time.perf_counter() - start, None)
+
+def main(args):
+    directory = tempfile.mkdtemp(prefix='benchmark-')
+
+    try:
+        with open(os.path.join(directory, 'tiny.obj'), 'w') as f:
+            f.write(TINY_OBJ)
+
+        print('{:<8} {:>10} {:>12}  {}'.format('measure', 'min (ms)', 'median (ms)', 'optional modules'))
+
+        for mode in args.measures:
+            results = [measure(mode, directory) for i in range(args.repeat)]
+            times = [1000 * seconds for (seconds, modules) in results]
+            modules = (results[0][1] or '-') if mode == 'import' else ''
+            print('{:<8} {:>10.1f} {:>12.1f}  {}'.format(mode, min(times), statistics.median(times), modules))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--measures', nargs='+', choices=['import', 'convert'], default=['import', 'convert'],
+                        help='What to measure')
+    parser.add_argument('-n', '--repeat', type=int, default=10,
+                        help='Number of runs of each measure')
+    parser.add_argument('--child', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        imports()
+    else:
+        main(args)
@@ -1,79 +1,16 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
+import glob
+import io
 import os
+import sys
+import time
 
 import d3.model.tools as mt
+from d3.model.cache import ConversionCache
+from d3.model.profiling import stage, Timings, CountingFile
 import functools as fc
-from d3.model.basemodel import Vector
-
-def PLYwithRGB(objFile, plyFile):
-	fileToMake = plyFile[:len(plyFile)-4]
-	fileToMake = fileToMake+"WithRGB.ply"
-
-	objFileOpened = open(objFile,"r")
-	plyFileOpened = open(plyFile,"r")
-	fileToMake = open(fileToMake, "w")
-	objFileData = []
-
-	for line in objFileOpened:
-		w = []
-		w = line[:-1].split(' ')    #Splitting each line by space and putting in list
-
-		if(len(w)==7):  #Checking if there are 7 elements in list
-			#Removing the first 4 elements of list 
-			w.remove(w[0])   
-			w.remove(w[0])
-			w.remove(w[0])
-			w.remove(w[0])
-
-			#Multiplying the remaining elements of list with 255 and converting to int
-			w[0] = int(float(w[0])*255)
-			w[1] = int(float(w[1])*255)
-			w[2] = int(float(w[2])*255)
-
-			objFileData.append(w)  #Appending list to objFile
-
-		else:
-			break
-
-	objFileOpened.close()
-	
-	vertex_count = 0
-	vertCounter = 0
-	for line in plyFileOpened:
-		vertCounter += 1
-		if(vertCounter == 4):
-			VertList = []
-			VertList = line[:-1].split(' ')    #Splitting each line by space and putting in list
-			vertex_count = int(VertList[2])
-			break
-
-	plyFileOpened.close()
-	plyFileOpened = open(plyFile,"r")
-
-	plyFileCounter = 0
-	objDataCounter = 0
-	for line in plyFileOpened:
-		plyFileCounter += 1
-		if(plyFileCounter <= 7):
-			fileToMake.write(line)
-		elif(plyFileCounter >= 8 and plyFileCounter <= 10):
-			fileToMake.write('property uchar red\n')		
-			fileToMake.write('property uchar green\n')		
-			fileToMake.write('property uchar blue\n')
-			fileToMake.write(line)
-			plyFileCounter += 3
-		elif(plyFileCounter >=11 and plyFileCounter <= 13):
-			fileToMake.write(line)
-		elif(plyFileCounter >= 14 and plyFileCounter <= vertex_count+13 and objDataCounter <= len(objFileData)-1):
-			line = line.replace('\n','')
-			fileToMake.write(line+" "+str(objFileData[objDataCounter][0])+" "+str(objFileData[objDataCounter][1])+" "+str(objFileData[objDataCounter][2])+"\n")
-			objDataCounter += 1
-		elif(plyFileCounter >= vertex_count+14):
-			fileToMake.write(line)
-
-	plyFileOpened.close()
-	fileToMake.close()
 
 def check_path(path, should_exist):
 	""" Check that a path (file or folder) exists or not and return it.
@@ -84,8 +21,114 @@ def check_path(path, should_exist):
 		raise argparse.ArgumentTypeError(msg)
 	return path
 
+def open_output(path):
+	""" Open an output path in binary mode, or the standard output if it is None.
+
+	The path is only replaced once the output is complete, see mt.replacing_file.
+	"""
+	if path is None:
+		return contextlib.nullcontext(sys.stdout.buffer)
+	return mt.replacing_file(path)
+
+def export_options(args, output):
+	""" Return the keyword arguments of the exporter of an output path.
+	"""
+	options = {}
+	if output.endswith('.ply'):
+		options['format'] = args.ply_format
+	elif output.endswith('.stl'):
+		options['format'] = args.stl_format
+	return options
+
+def batch_jobs(args):
+	""" Return the (input, output) paths of the files to convert in batch mode.
+
+	The inputs are the lines of the manifest, which may give their output after
+	a tab, or the files of the input directory matching the pattern. The other
+	outputs are in the output directory, with the extension of the type.
+	"""
+	if args.manifest is not None:
+		with open(args.manifest) as f:
+			lines = [line.rstrip('\n').split('\t') for line in f if line.strip() != '']
+		inputs = [(line[0], line[1] if len(line) > 1 else None) for line in lines]
+		root = None
+	else:
+		root = args.input_dir
+		pattern = os.path.join(glob.escape(root), args.pattern)
+		inputs = [(path, None) for path in sorted(glob.glob(pattern, recursive=True)) if os.path.isfile(path)]
+
+	jobs = []
+	for (input, output) in inputs:
+		if output is None:
+			if args.output_dir is None or args.type is None:
+				raise Exception("output-dir and type args are needed for the inputs without output")
+			relative = os.path.relpath(input, root) if root is not None else os.path.basename(input)
+			output = os.path.join(args.output_dir, os.path.splitext(relative)[0] + '.' + args.type)
+		jobs.append((input, output))
+
+	return jobs
+
+def batch(args, up_conversion, transform):
+	""" Convert many files with a pool of processes and report each of them.
+	"""
+	jobs = batch_jobs(args)
+	cache = ConversionCache(args.cache_dir, args.cache_size << 20) if args.cache_dir is not None else None
+
+	for output in set(os.path.dirname(output) for (input, output) in jobs):
+		if output != '':
+			os.makedirs(output, exist_ok=True)
+
+	# All the outputs have the same type, except in manifests
+	options = dict((output, export_options(args, output)) for (input, output) in jobs)
+	failures = 0
+	start = time.perf_counter()
+
+	for extension in sorted(set(os.path.splitext(output)[1] for (input, output) in jobs)):
+		selected = [(input, output) for (input, output) in jobs if output.endswith(extension)]
+		results = mt.convert_many(selected, up_conversion, args.mmap, args.processes, args.force, cache,
+								  transform, args.stream, args.weld, **options[selected[0][1]])
+
+		for (input, output, seconds, error) in results:
+			if error is not None:
+				failures += 1
+				print('FAILED  {:8.3f}s {} -> {}: {}'.format(seconds, input, output, error), file=sys.stderr)
+			elif seconds is None:
+				print('skipped           {} -> {}'.format(input, output), file=sys.stderr)
+			else:
+				print('ok      {:8.3f}s {} -> {}'.format(seconds, input, output), file=sys.stderr)
+
+	print('{} files, {} failed, {:.3f}s'.format(len(jobs), failures, time.perf_counter() - start), file=sys.stderr)
+
+	if failures > 0:
+		sys.exit(1)
+
 def main(args):
+	""" Convert the input, or the files of the batch mode.
+
+	With the profile arg, the stages of the conversion are printed on the
+	standard error, and the statistics of cProfile are saved if a path is given.
+	"""
+	if args.profile is None:
+		return convert(args, None)
+
+	if args.input_dir is not None or args.manifest is not None:
+		raise Exception("profile arg is not supported in batch mode")
 
+	timings = Timings()
+
+	if args.profile == '':
+		convert(args, timings)
+	else:
+		import cProfile
+		profile = cProfile.Profile()
+		profile.runcall(convert, args, timings)
+		profile.dump_stats(args.profile)
+
+	print(timings.report(), file=sys.stderr)
+
+def convert(args, hook):
+	""" Convert the input, giving the time of each stage to the hook if it is not None.
+	"""
 	if (args.from_up is None) != (args.to_up is None):
 		raise Exception("from-up and to-up args should be both present or both absent")
 
@@ -93,15 +136,86 @@ def main(args):
 	if args.from_up is not None:
 		up_conversion = (args.from_up, args.to_up)
 
+	if args.scale is not None and len(args.scale) not in (1, 3):
+		raise Exception("scale arg should be one factor or three factors")
+
+	# Scaled, then translated, after the up conversion
+	transform = None
+	if args.scale is not None or args.translate is not None:
+		transform = mt.translation_matrix(*(args.translate or [0, 0, 0]))
+		transform = transform.dot(mt.scaling_matrix(*(args.scale or [1])))
+
+	if args.stream and args.weld is not None:
+		raise Exception("weld arg cannot be used with stream, which never has the whole model")
+
+	if args.input_dir is not None or args.manifest is not None:
+		batch(args, up_conversion, transform)
+		return
+
 	output = args.output if args.output is not None else '.' + args.type
+	options = export_options(args, output)
 
-	result = mt.convert(args.input, output, up_conversion)
+	cache = None
+	if args.cache_dir is not None:
+		cache = ConversionCache(args.cache_dir, args.cache_size << 20)
 
-	if args.output is None:
-		print(result)
-	else:
-		with open(args.output, 'w') as f:
-			f.write(result)
+	# Path None is the standard output
+	outputs = [(args.output, options)]
+
+	# The colored ply is written from the same model, without reading the
+	# files again
+	if args.output is not None and args.output.endswith('.ply') and not args.rgb_only:
+		outputs = [(args.output, dict(options, colors=False)), (args.output[:-4] + 'WithRGB.ply', options)]
+
+	# Each output reads the input again, piece by piece
+	if args.stream:
+		for (path, options) in outputs:
+			with open_output(path) as f:
+				mt.convert(args.input, output, up_conversion, f, cache=cache, transform=transform, hook=hook,
+						   stream=True, **options)
+		return
+
+	if cache is not None:
+		# Welding changes the model, but it is not an option of the exporter
+		keys = [cache.key(args.input, output, up_conversion, dict(options, weld=args.weld), transform)
+				for (path, options) in outputs]
+
+		if all(map(cache.contains, keys)):
+			for ((path, options), key) in zip(outputs, keys):
+				# An empty entry is a colored ply that is not written
+				if cache.size(key) == 0:
+					continue
+				with open_output(path) as f, stage(hook, 'cache') as counts:
+					counts['hit'] = cache.copy(key, f)
+			return
+
+	model = mt.load_model(args.input, up_conversion, args.mmap, args.processes, transform, hook)
+
+	if args.weld is not None:
+		with stage(hook, 'weld') as counts:
+			model.weld_vertices(args.weld)
+			counts['vertices'] = model.get_count('vertices')
+
+	# Without colors, only the first ply is written, and the cache keeps an
+	# empty entry for the other one so that the next conversions are hits
+	if model.get_count('colors') == 0:
+		if cache is not None and len(outputs) > 1:
+			with cache.storing(keys[1], io.BytesIO()):
+				pass
+		outputs = outputs[:1]
+
+	for (index, (path, options)) in enumerate(outputs):
+		with open_output(path) as f:
+			exporter = mt.export_model(model, output, hook, **options)
+
+			with stage(hook, 'write') as counts:
+				counter = CountingFile(f)
+				if cache is None:
+					exporter.write(counter)
+				else:
+					with cache.storing(keys[index], counter) as stored:
+						exporter.write(stored)
+				counts['bytes'] = counter.size
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser()
@@ -118,10 +232,50 @@ if __name__ == '__main__':
 						help="Initial up vector")
 	parser.add_argument('-tu', '--to-up', metavar='fup', default=None,
 						help="Output up vector")
+	parser.add_argument('--scale', metavar='factor', type=float, nargs='+',
+						help="Scale the model after the up conversion, by one factor or one per axis")
+	parser.add_argument('--translate', metavar='offset', type=float, nargs=3,
+						help="Translate the model after the up conversion and the scaling")
+	parser.add_argument('--rgb-only', action='store_true',
+						help="Only write the ply with vertex colors, to the output path")
+	parser.add_argument('--ply-format', default='ascii',
+						choices=['ascii', 'binary_little_endian', 'binary_big_endian'],
+						help="Format of the ply output")
+	parser.add_argument('--stl-format', default='ascii',
+						choices=['ascii', 'binary'],
+						help="Format of the stl output")
+	parser.add_argument('--weld', metavar='epsilon', type=float, nargs='?', const=0.0, default=None,
+						help="Merge the coincident vertices of the input, e.g. the ones of stl files, "
+						"optionally the ones closer than epsilon")
+	parser.add_argument('--stream', action='store_true',
+						help="Convert the input piece by piece without loading the whole model, for inputs "
+						"bigger than the memory, e.g. obj to ply, ply to off or stl to obj")
+	parser.add_argument('--mmap', action='store_true',
+						help="Map binary input files in memory instead of reading them")
+	parser.add_argument('-j', '--processes', metavar='processes', type=int, default=None,
+						help="Number of processes parsing the input in parallel, for obj files, "
+						"or converting files in parallel in batch mode")
+	parser.add_argument('--input-dir', metavar='input-dir',
+						type=fc.partial(check_path, should_exist=True),
+						help="Batch mode: convert the files of this directory matching the pattern")
+	parser.add_argument('--pattern', metavar='pattern', default='*.obj',
+						help="Glob pattern of the files of the input directory, ** matches subdirectories")
+	parser.add_argument('--manifest', metavar='manifest',
+						type=fc.partial(check_path, should_exist=True),
+						help="Batch mode: convert the files listed in this file, one per line, "
+						"optionally followed by a tab and the output path")
+	parser.add_argument('--output-dir', metavar='output-dir',
+						help="Batch mode: directory of the outputs, which have the extension of the type")
+	parser.add_argument('--force', action='store_true',
+						help="Batch mode: convert the files even if their output is newer")
+	parser.add_argument('--cache-dir', metavar='cache-dir',
+						help="Directory of a cache of the converted models, keyed by the content of the "
+						"input and the conversion options")
+	parser.add_argument('--cache-size', metavar='megabytes', type=int, default=1024,
+						help="Maximum size of the cache, the least recently used models are removed")
+	parser.add_argument('--profile', metavar='stats', nargs='?', const='', default=None,
+						help="Print the time of each stage of the conversion, and save the cProfile "
+						"statistics to the stats path if it is given, e.g. for pstats or snakeviz")
 	args = parser.parse_args()
 	args.func(args)
 
-	objFile = args.input
-	plyFile = args.output
-	PLYwithRGB(objFile,plyFile)
-
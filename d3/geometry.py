@@ -5,6 +5,7 @@ class Vector:
 
     Simple class that represents a 3D vector
     """
+    __slots__ = ('x', 'y', 'z')
 
     def __init__(self, x = 0.0, y = 0.0, z = 0.0):
         """
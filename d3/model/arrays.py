@@ -0,0 +1,438 @@
+import itertools
+
+from ..geometry import Vector
+
+import numpy as np
+
+FLOAT_DTYPE = 'float32'
+"""Type of the coordinates stored in arrays
+"""
+
+INDEX_DTYPE = 'int32'
+"""Type of the indices stored in arrays
+"""
+
+def vectors_to_array(vectors, width):
+    """Builds a contiguous (N, width) array from a list of vectors
+
+    :param vectors: list of Vector
+    :param width: number of coordinates kept for each vector, 2 or 3
+    """
+    if width == 2:
+        rows = [(v.x, v.y) for v in vectors]
+    else:
+        rows = [(v.x, v.y, v.z) for v in vectors]
+
+    if len(rows) == 0:
+        return np.empty((0, width), dtype=FLOAT_DTYPE)
+
+    return np.array(rows, dtype=FLOAT_DTYPE)
+
+def format_floats(array):
+    """Returns the shortest strings that give back the coordinates of an array
+
+    A float32 read from 0.1 is written 0.1 and not 0.10000000149011612. The
+    strings are returned in the order of array.ravel().
+
+    :param array: the array to format
+    """
+    values = array.ravel()
+
+    if values.dtype != np.float32:
+        return list(map(repr, values.tolist()))
+
+    strings = None
+    remaining = np.arange(len(values))
+
+    # A float32 is always given back by 9 significant digits, but most of the
+    # time less are enough
+    for digits in (6, 7, 8, 9):
+        text = ('%.{}g '.format(digits)) * len(remaining) % tuple(values[remaining].tolist())
+        current = text.split()
+
+        if strings is None:
+            strings = current
+        else:
+            for (i, string) in zip(remaining.tolist(), current):
+                strings[i] = string
+
+        if digits == 9:
+            break
+
+        remaining = remaining[np.fromstring(text, dtype=values.dtype, sep=' ') != values[remaining]]
+        if len(remaining) == 0:
+            break
+
+    return strings
+
+def format_rows(*arrays):
+    """Returns a string for each row of the arrays
+
+    The values of a row of each array are separated by spaces, and the rows of
+    the arrays are concatenated, e.g. format_rows(vertices, colors) gives
+    "x y z r g b" strings.
+
+    :param arrays: 2D arrays with the same number of rows
+    """
+    columns = []
+
+    for array in arrays:
+        if array.dtype.kind == 'f':
+            strings = format_floats(array)
+        else:
+            strings = list(map(str, array.ravel().tolist()))
+
+        width = array.shape[1]
+        columns += [strings[i::width] for i in range(width)]
+
+    return list(map(' '.join, zip(*columns)))
+
+def quantize_colors(colors):
+    """Converts colors between 0 and 1 to bytes between 0 and 255
+
+    The values are rounded to the nearest byte, and the ones outside [0, 1]
+    are clamped.
+
+    :param colors: array of colors, e.g. (N, 3) or (N, 4) with alpha
+    """
+    bytes = np.rint(np.asarray(colors, dtype='float64') * 255)
+    return np.clip(np.nan_to_num(bytes, copy=False), 0, 255).astype('uint8')
+
+def up_conversion_matrix(up_conversion):
+    """Returns the 4x4 matrix of a conversion of the up vector
+
+    Returns None if the conversion is not supported.
+
+    :param up_conversion: couple of characters, can be y z or z y
+    """
+    if tuple(up_conversion) == ('y', 'z'):
+        # (x, y, z) becomes (y, z, x)
+        permutation = [1, 2, 0]
+    elif tuple(up_conversion) == ('z', 'y'):
+        permutation = [2, 0, 1]
+    else:
+        return None
+
+    matrix = np.zeros((4, 4))
+    matrix[[0, 1, 2], permutation] = 1
+    matrix[3, 3] = 1
+    return matrix
+
+def scaling_matrix(x, y = None, z = None):
+    """Returns the 4x4 matrix of a scaling
+
+    :param x: factor of the x coordinates, and of all of them if y and z are
+    None
+    :param y: factor of the y coordinates
+    :param z: factor of the z coordinates
+    """
+    return np.diag([x, x if y is None else y, x if z is None else z, 1.0])
+
+def translation_matrix(x, y, z):
+    """Returns the 4x4 matrix of a translation
+
+    :param x: translation along x
+    :param y: translation along y
+    :param z: translation along z
+    """
+    matrix = np.identity(4)
+    matrix[:3, 3] = [x, y, z]
+    return matrix
+
+def transform_array(array, matrix, normals = False):
+    """Applies a 4x4 transform to a (N, 3) array
+
+    Normals are transformed by the inverse transpose of the linear part of the
+    matrix, without translation, and normalized again if it is not a rotation.
+
+    :param array: the vertices or the normals to transform
+    :param matrix: the 4x4 matrix of the transform
+    :param normals: whether the array contains normals
+    """
+    linear = matrix[:3, :3]
+
+    if not normals:
+        return (np.dot(array.astype('float64'), linear.T) + matrix[:3, 3]).astype(array.dtype)
+
+    linear = np.linalg.inv(linear).T
+    result = np.dot(array.astype('float64'), linear.T)
+
+    if not np.allclose(np.dot(linear, linear.T), np.identity(3)):
+        result = _normalize(result)
+
+    return result.astype(array.dtype)
+
+def array_to_vectors(array):
+    """Builds a list of vectors from a (N, 2) or (N, 3) array
+
+    The coordinates are the shortest decimal values that give back the ones of
+    the array, see format_floats.
+
+    :param array: the array to convert
+    """
+    values = list(map(float, format_floats(array)))
+    width = array.shape[1]
+    return [Vector(*values[i:i+width]) for i in range(0, len(values), width)]
+
+class ArrayBacked:
+    """Attribute of a model that is a list of vectors or a numpy array
+
+    Parsers may fill the attribute with a (N, width) array. The list of Vector
+    is then only built when the attribute is accessed, and becomes the
+    reference until the array is asked for again.
+    """
+    def __init__(self, width):
+        """Creates the attribute
+
+        :param width: number of coordinates of each vector
+        """
+        self.width = width
+
+    def __set_name__(self, owner, name):
+        self.list_name = '_' + name
+        self.array_name = '_' + name + '_array'
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        objects = instance.__dict__.get(self.list_name)
+
+        if objects is None:
+            array = instance.__dict__.get(self.array_name)
+            objects = array_to_vectors(array) if array is not None else []
+            instance.__dict__[self.list_name] = objects
+            instance.__dict__[self.array_name] = None
+
+        return objects
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.list_name] = value
+        instance.__dict__[self.array_name] = None
+
+    def get_array(self, instance):
+        """Returns the attribute of the instance as an array
+
+        :param instance: the model that owns the attribute
+        """
+        array = instance.__dict__.get(self.array_name)
+
+        if array is None:
+            array = vectors_to_array(instance.__dict__.get(self.list_name) or [], self.width)
+            instance.__dict__[self.array_name] = array
+            instance.__dict__[self.list_name] = None
+
+        return array
+
+    def set_array(self, instance, array):
+        """Replaces the attribute of the instance by an array
+
+        :param instance: the model that owns the attribute
+        :param array: a (N, width) array
+        """
+        instance.__dict__[self.array_name] = array
+        instance.__dict__[self.list_name] = None
+
+    def count(self, instance):
+        """Returns the number of elements without building any list
+
+        :param instance: the model that owns the attribute
+        """
+        array = instance.__dict__.get(self.array_name)
+        if array is not None:
+            return len(array)
+        return len(instance.__dict__.get(self.list_name) or [])
+
+def _normalize(vectors):
+    """Divides (N, 3) vectors by their norm, except the null ones
+
+    Unlike Vector.normalize, small vectors are normalized too: the cross
+    products of the edges of small faces are small.
+
+    :param vectors: the vectors to normalize
+    """
+    norm = np.sqrt((vectors * vectors).sum(axis=1))
+    norm[norm == 0] = 1
+    return vectors / norm[:, np.newaxis]
+
+def _accumulate(vectors, indices, length):
+    """Sums (F, 3) vectors by index into a (length, 3) array
+
+    :param vectors: the vectors to sum
+    :param indices: the index in the result of each vector
+    :param length: the number of rows of the result
+    """
+    return np.stack([np.bincount(indices, vectors[:, i], length) for i in range(3)], axis=1)
+
+def face_normals(vertices, faces):
+    """Returns the unit normals of triangles as a (F, 3) array
+
+    The normal of a face is the cross product of its edges from its first
+    vertex, or zero for degenerate faces.
+
+    :param vertices: (N, 3) array of the vertices
+    :param faces: (F, 3) array of the vertex indices of the triangles
+    """
+    (a, b, c) = (vertices[faces[:, i]].astype('float64') for i in range(3))
+    return _normalize(np.cross(b - a, c - a)).astype(FLOAT_DTYPE)
+
+VERTEX_NORMAL_WEIGHTINGS = ['area', 'angle']
+"""Ways of weighting the normals of the faces around a vertex
+"""
+
+def vertex_normals(vertices, faces, weighting = 'area'):
+    """Returns the unit normals of the vertices of triangles as a (N, 3) array
+
+    The normal of a vertex is the weighted sum of the normals of its faces.
+
+    :param vertices: (N, 3) array of the vertices
+    :param faces: (F, 3) array of the vertex indices of the triangles
+    :param weighting: area to weight the faces by their area, angle to weight
+    them by their angle at the vertex
+    """
+    if weighting not in VERTEX_NORMAL_WEIGHTINGS:
+        raise ValueError('Unknown weighting ' + weighting)
+
+    corners = [vertices[faces[:, i]].astype('float64') for i in range(3)]
+
+    # The norm of the cross product is twice the area of the face
+    cross = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+    normals = np.zeros((len(vertices), 3))
+
+    for i in range(3):
+        if weighting == 'area':
+            weighted = cross
+        else:
+            edge1 = corners[(i + 1) % 3] - corners[i]
+            edge2 = corners[(i + 2) % 3] - corners[i]
+            sine = np.sqrt((cross * cross).sum(axis=1))
+            angle = np.arctan2(sine, (edge1 * edge2).sum(axis=1))
+            weighted = _normalize(cross) * angle[:, np.newaxis]
+
+        normals += _accumulate(weighted, faces[:, i], len(vertices))
+
+    return _normalize(normals).astype(FLOAT_DTYPE)
+
+def _first_occurrences(rows):
+    """Groups the equal rows of a (N, k) array
+
+    Returns (first, group): first are the indices of the first row of each
+    group, in increasing order, and group gives the group of each row.
+
+    :param rows: (N, k) array
+    """
+    rows = np.ascontiguousarray(rows)
+    rows = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+
+    (_, first, inverse) = np.unique(rows, return_index=True, return_inverse=True)
+
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    return (first[order], rank[inverse.ravel()])
+
+CELL_HASH = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype='uint64')
+"""Factors of the coordinates of a cell of a grid in its hash
+
+The hash is linear, so the hash of a neighbour cell is the hash of the cell
+plus the hash of the offset between them.
+"""
+
+NEIGHBOUR_CELLS = np.array([d for d in itertools.product((-1, 0, 1), repeat=3) if d >= (0, 0, 0)], dtype='int64')
+"""Offsets of a cell of a grid and of its neighbours, one of each opposite pair
+"""
+
+WELD_BATCH = 1 << 22
+"""Maximum number of pairs of points of neighbour cells compared at once
+"""
+
+def _cell_hash(cells):
+    """Returns the hash of the cells of a grid, which wraps around on overflow
+
+    :param cells: (N, 3) integer array
+    """
+    cells = cells.astype('uint64')
+    return cells[:, 0] * CELL_HASH[0] + cells[:, 1] * CELL_HASH[1] + cells[:, 2] * CELL_HASH[2]
+
+def _close_points(points, epsilon):
+    """Returns the pairs of points whose coordinates differ by at most epsilon
+
+    Returns (i, j) arrays of point indices, with i < j, sorted by i then j.
+    The points are put in buckets by the hash of their cell in a grid of size
+    epsilon, and only the points of the same bucket or of the buckets of
+    neighbour cells are compared. Two cells with the same hash only cost more
+    comparisons.
+
+    :param points: (N, 3) array of distinct points
+    :param epsilon: largest difference of the coordinates of close points
+    """
+    keys = _cell_hash(np.floor(points / epsilon).astype('int64'))
+    members = np.argsort(keys, kind='stable')
+    keys = keys[members]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    buckets = keys[starts]
+    counts = np.diff(np.append(starts, len(keys)))
+
+    pairs = [(np.empty(0, dtype='int64'), np.empty(0, dtype='int64'))]
+
+    for offset in _cell_hash(NEIGHBOUR_CELLS):
+        if offset == 0:
+            # A point alone in its bucket has no pair in it
+            a = b = np.flatnonzero(counts > 1)
+        else:
+            index = np.minimum(np.searchsorted(buckets, buckets + offset), len(buckets) - 1)
+            a = np.flatnonzero(buckets[index] == buckets + offset)
+            b = index[a]
+
+        # All the pairs of points of the buckets a and b, in batches
+        sizes = counts[a] * counts[b]
+        ends = np.cumsum(sizes)
+        bounds = np.unique(np.searchsorted(ends, np.arange(0, ends[-1] if len(ends) else 0, WELD_BATCH), 'right'))
+
+        for (begin, end) in zip(bounds.tolist(), bounds[1:].tolist() + [len(a)]):
+            n = sizes[begin:end]
+            pair = np.repeat(np.arange(begin, end), n)
+            within = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            i = members[starts[a][pair] + within // counts[b][pair]]
+            j = members[starts[b][pair] + within % counts[b][pair]]
+
+            close = (i != j) & (np.abs(points[i] - points[j]) <= epsilon).all(axis=1)
+            pairs.append((np.minimum(i, j)[close], np.maximum(i, j)[close]))
+
+    (i, j) = map(np.concatenate, zip(*pairs))
+    order = np.lexsort((j, i))
+    return (i[order], j[order])
+
+def weld(vertices, epsilon = 0):
+    """Finds the coincident vertices of a (N, 3) array
+
+    Returns (kept, remap): kept are the indices of the vertices to keep, in the
+    order of their first occurrence, and remap gives the new index of each
+    vertex. Vertices are coincident if they are equal. With an epsilon, each
+    vertex that is not merged yet also takes the following ones whose
+    coordinates differ from its own by at most epsilon, as long as they are
+    not merged.
+
+    :param vertices: (N, 3) array of the vertices
+    :param epsilon: largest difference of the coordinates of merged vertices,
+    0 to merge equal vertices
+    """
+    # Adding 0 turns -0 into 0, which has other bytes
+    (kept, remap) = _first_occurrences(vertices + vertices.dtype.type(0))
+
+    if epsilon > 0 and len(kept) > 0:
+        # The point each point is merged into, itself for the kept ones. The
+        # pairs are sorted, so a point is merged or kept before its own pairs
+        target = list(range(len(kept)))
+        (i, j) = _close_points(vertices[kept].astype('float64'), epsilon)
+
+        for (point, other) in zip(i.tolist(), j.tolist()):
+            if target[point] == point and target[other] == other:
+                target[other] = point
+
+        target = np.array(target)
+        is_kept = target == np.arange(len(target))
+        (kept, remap) = (kept[is_kept], (np.cumsum(is_kept) - 1)[target][remap])
+
+    return (kept, remap.astype(INDEX_DTYPE))
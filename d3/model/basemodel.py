@@ -1,6 +1,12 @@
+import contextlib
+import mmap
+import os
+import shutil
+import tempfile
 from math import sqrt
 from ..geometry import Vector
 from .mesh import Material, MeshPart
+from .arrays import ArrayBacked, np, weld, face_normals, vertex_normals, up_conversion_matrix, transform_array, INDEX_DTYPE
 
 Vertex = Vector
 TexCoord = Vertex
@@ -17,6 +23,8 @@ class FaceVertex:
     :param normal: index of the normal
     :param color: index of the color
     """
+    __slots__ = ('vertex', 'tex_coord', 'normal', 'color')
+
     def __init__(self, vertex = None, tex_coord = None, normal = None, color = None):
         """Initializes a FaceVertex from its indices
         """
@@ -58,6 +66,8 @@ class Face:
     split your face first and then create the number needed of instances of
     this class.
     """
+    __slots__ = ('a', 'b', 'c', 'material')
+
     def __init__(self, a = None, b = None, c = None, material = None):
         """Initializes a Face with its three FaceVertex and its Material
 
@@ -83,23 +93,78 @@ class Face:
         self.c = FaceVertex().from_array(arr[2])
         return self
 
+def _concatenate_pieces(pieces, width, counts, partial = False):
+    """Concatenates the index arrays of the parts of a batch of faces
+
+    :param pieces: list of the lists of the arrays of each part
+    :param width: number of arrays of each part
+    :param counts: number of faces of each part
+    :param partial: whether the parts without an attribute get -1 indices
+    when other parts have it, instead of making its array None
+    """
+    arrays = []
+
+    for i in range(width):
+        column = [piece[i] for piece in pieces]
+
+        if partial and any(array is not None for array in column):
+            column = [array if array is not None else np.full((count, 3), -1, dtype=INDEX_DTYPE)
+                      for (array, count) in zip(column, counts)]
+
+        if any(array is None for array in column):
+            arrays.append(None)
+        elif len(column) == 1:
+            arrays.append(column[0])
+        else:
+            arrays.append(np.concatenate(column))
+
+    return arrays
+
 class ModelParser:
     """Represents a 3D model
+
+    The vertices, normals, colors and texture coordinates are lists of Vector,
+    but parsers may store them as numpy arrays with set_array, in which case
+    the lists are only built when they are accessed.
     """
+    vertices = ArrayBacked(3)
+    colors = ArrayBacked(3)
+    normals = ArrayBacked(3)
+    tex_coords = ArrayBacked(2)
+
     def __init__(self, up_conversion = None):
         """Initializes the model
 
+        Parsers of binary formats read the file with map_file instead of by
+        chunk when memory_map is set to True. Parsers that can split the file
+        parse it with as many processes as the processes attribute, if set.
+
+        The up conversion, like the transforms added with add_transform, is
+        only applied to the vertices and the normals by apply_transforms, once
+        the file is parsed.
+
         :param up_conversion: couple of characters, can be y z or z y
         """
         self.up_conversion = up_conversion
+        self.pending_transform = None
         self.vertices = []
         self.colors = []
         self.normals = []
         self.tex_coords = []
+        # Array of the opacity of the vertices between 0 and 1, if the file has
+        # some, filled by the parsers that read the colors in bulk
+        self.alphas = None
         self.parts = []
         self.materials = []
+        self.material_indices = {}
         self.current_part = None
         self.path = None
+        self.memory_map = False
+        self.processes = None
+        self.map = None
+
+        if up_conversion is not None and up_conversion_matrix(up_conversion) is not None:
+            self.add_transform(up_conversion_matrix(up_conversion))
 
     def init_textures(self):
         """Initializes the textures of the parts of the model
@@ -112,20 +177,43 @@ class ModelParser:
     def add_vertex(self, vertex):
         """Adds a vertex to the current model
 
-        Will also update its bounding box, and convert the up vector if
-        up_conversion was specified.
+        The up vector is converted later, by apply_transforms.
 
         :param vertex: vertex to add to the model
         """
-        # Apply up_conversion to the vertex
-        new_vertex = vertex
-        if self.up_conversion is not None:
-            if self.up_conversion[0] == 'y' and self.up_conversion[1] == 'z':
-                new_vertex = Vector(vertex.y, vertex.z, vertex.x)
-            elif self.up_conversion[0] == 'z' and self.up_conversion[1] == 'y':
-                new_vertex = Vector(vertex.z, vertex.x, vertex.y)
+        self.vertices.append(vertex)
+
+    def add_transform(self, matrix):
+        """Adds a transform to the ones pending
+
+        The transforms are composed and applied all at once to the vertices
+        and the normals of the model by apply_transforms.
+
+        :param matrix: 4x4 matrix of the transform, applied after the pending
+        ones
+        """
+        if self.pending_transform is None:
+            self.pending_transform = np.array(matrix, dtype='float64')
+        else:
+            self.pending_transform = np.dot(matrix, self.pending_transform)
+
+    def apply_transforms(self):
+        """Applies the pending transforms to the vertices and the normals
+
+        load_model calls it once the file is parsed, and exporters before
+        exporting the model.
+        """
+        if self.pending_transform is None:
+            return
+
+        matrix = self.pending_transform
+        self.pending_transform = None
 
-        self.vertices.append(new_vertex)
+        if self.get_count('vertices') > 0:
+            self.set_array('vertices', transform_array(self.get_array('vertices'), matrix))
+
+        if self.get_count('normals') > 0:
+            self.set_array('normals', transform_array(self.get_array('normals'), matrix, normals=True))
 
     def add_tex_coord(self, tex_coord):
         """Adds a texture coordinate element to the current model
@@ -163,7 +251,113 @@ class ModelParser:
 
         self.current_part.add_face(face)
 
-    def parse_file(self, path, chunk_size = 512):
+    def add_face_array(self, vertex, tex_coord = None, normal = None, material = None):
+        """Adds faces given as (F, 3) arrays of indices to the current model
+
+        The mesh parts are managed the same way as in add_face.
+
+        :param vertex: array of the vertex indices of the faces
+        :param tex_coord: array of the texture coordinate indices, or None
+        :param normal: array of the normal indices, or None
+        :param material: the material to use with these faces
+        """
+        if self.current_part is None or (material != self.current_part.material and material is not None):
+            self.current_part = MeshPart(self)
+            self.current_part.material = material if material is not None else Material.DEFAULT_MATERIAL
+            self.parts.append(self.current_part)
+
+        self.current_part.add_face_array(vertex, tex_coord, normal)
+
+    def get_array(self, name):
+        """Returns an attribute of the model as a numpy array
+
+        :param name: vertices, colors, normals or tex_coords
+        """
+        return getattr(type(self), name).get_array(self)
+
+    def set_array(self, name, array):
+        """Replaces an attribute of the model by a numpy array
+
+        :param name: vertices, colors, normals or tex_coords
+        :param array: a (N, 3) array, or (N, 2) for tex_coords
+        """
+        getattr(type(self), name).set_array(self, array)
+
+    def get_count(self, name):
+        """Returns the number of elements of an attribute of the model
+
+        Unlike len, it does not build the list of vectors of an array.
+
+        :param name: vertices, colors, normals or tex_coords
+        """
+        return getattr(type(self), name).count(self)
+
+    def get_index_array(self, attribute = 'vertex'):
+        """Returns the indices of all the faces of the model as a (F, 3) array
+
+        :param attribute: vertex, tex_coord or normal
+        """
+        arrays = [part.get_index_array(attribute) for part in self.parts]
+
+        if len(arrays) == 0:
+            return np.empty((0, 3), dtype=INDEX_DTYPE)
+
+        if any(array is None for array in arrays):
+            return None
+
+        return np.concatenate(arrays)
+
+    def face_count(self):
+        """Returns the number of faces of all the parts without building them
+        """
+        return sum(part.face_count() for part in self.parts)
+
+    def iter_faces(self):
+        """Generates the Face of all the parts, one part after the other
+        """
+        for part in self.parts:
+            yield from part.faces
+
+    def face_batches(self, attributes = ('vertex',), batch_size = 16384, partial = False):
+        """Generates the faces of all the parts in batches of index arrays
+
+        Consecutive parts are gathered in the same batch, so that models with
+        many small parts are exported as fast as models with a single part.
+        Yields (runs, arrays) couples: runs is the list of the (part, count)
+        of the faces of the batch, and arrays the (batch_size, 3) array of
+        each attribute, None if a part does not have it.
+
+        :param attributes: vertex, tex_coord and / or normal
+        :param batch_size: maximum number of faces in a batch
+        :param partial: if some faces of a batch have an attribute, its array
+        has -1 indices for the others instead of being None
+        """
+        runs = []
+        pieces = []
+        size = 0
+
+        for part in self.parts:
+            arrays = [part.get_index_array(attribute, partial) for attribute in attributes]
+            count = part.face_count()
+            begin = 0
+
+            while begin < count:
+                end = min(count, begin + batch_size - size)
+                runs.append((part, end - begin))
+                pieces.append([array[begin:end] if array is not None else None for array in arrays])
+                size += end - begin
+                begin = end
+
+                if size == batch_size:
+                    yield (runs, _concatenate_pieces(pieces, len(attributes), [count for (part, count) in runs], partial))
+                    runs = []
+                    pieces = []
+                    size = 0
+
+        if size > 0:
+            yield (runs, _concatenate_pieces(pieces, len(attributes), [count for (part, count) in runs], partial))
+
+    def parse_file(self, path, chunk_size = 1 << 20):
         """Sets the path of the model and parse bytes by chunk
 
         :param path: path to the file to parse
@@ -180,6 +374,56 @@ class ModelParser:
                 self.parse_bytes(bytes, byte_counter)
                 byte_counter += chunk_size
 
+    def stream_file(self, path):
+        """Generates the model of a file piece by piece
+
+        The pieces are this model, emptied with clear and filled with the
+        next elements of the file: the vertices and the faces of a piece are
+        the ones of a part of the file, the indices of the faces are the ones
+        of the whole file, and the pending transforms are applied to each
+        piece. A piece must be exported before the next one is read.
+
+        Parsers that can read a file batch by batch override it, so that the
+        whole model is never in memory. This one parses the whole file and
+        generates a single piece.
+
+        :param path: path to the file to parse
+        """
+        self.parse_file(path)
+        self.apply_transforms()
+        yield self
+
+    def clear(self):
+        """Removes the elements and the parts of the model
+
+        The materials are kept, so that the pieces of stream_file may use the
+        ones defined in the previous pieces.
+        """
+        self.vertices = []
+        self.colors = []
+        self.normals = []
+        self.tex_coords = []
+        self.alphas = None
+        self.parts = []
+        self.current_part = None
+
+    def map_file(self, path):
+        """Sets the path of the model and maps the file in memory
+
+        The map is kept in the model, because arrays of the model may be views
+        on it: the pages of the file are then only read when they are used,
+        and they are not copied in the memory of the process.
+
+        :param path: path to the file to map
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                self.map = b''
+            else:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
     def draw(self):
         """Draws each part of the model with OpenGL
         """
@@ -194,60 +438,94 @@ class ModelParser:
         for part in self.parts:
             part.generate_vbos()
 
-    def generate_vertex_normals(self):
+    def generate_vertex_normals(self, weighting = 'area'):
         """Generate the normals for each vertex of the model
 
         A normal will be the average normal of the adjacent faces of a vertex.
-        """
-        self.normals = [Normal() for i in self.vertices]
 
-        for part in self.parts:
-            for face in part.faces:
-                v1 = Vertex.from_points(self.vertices[face.a.vertex], self.vertices[face.b.vertex])
-                v2 = Vertex.from_points(self.vertices[face.a.vertex], self.vertices[face.c.vertex])
-                v1.normalize()
-                v2.normalize()
-                cross = Vertex.cross_product(v1, v2)
-                self.normals[face.a.vertex] += cross
-                self.normals[face.b.vertex] += cross
-                self.normals[face.c.vertex] += cross
-
-        for normal in self.normals:
-            normal.normalize()
+        :param weighting: area or angle, see arrays.vertex_normals
+        """
+        vertices = self.get_array('vertices')
+        self.set_array('normals', vertex_normals(vertices, self.get_index_array('vertex'), weighting))
 
         for part in self.parts:
-            for face in part.faces:
-                face.a.normal = face.a.vertex
-                face.b.normal = face.b.vertex
-                face.c.normal = face.c.vertex
+            part.set_index_array('normal', part.get_index_array('vertex'))
 
     def generate_face_normals(self):
         """Generate the normals for each face of the model
 
         A normal will be the normal of the face
         """
-        # Build array of faces
-        faces = sum(map(lambda x: x.faces, self.parts), [])
-        self.normals = [Normal()] * len(faces)
+        self.set_array('normals', face_normals(self.get_array('vertices'), self.get_index_array('vertex')))
+
+        begin = 0
+        for part in self.parts:
+            end = begin + part.face_count()
+            part.set_index_array('normal', np.repeat(np.arange(begin, end, dtype=INDEX_DTYPE), 3).reshape(-1, 3))
+            begin = end
+
+    def weld_vertices(self, epsilon = 0):
+        """Merges the coincident vertices of the model
+
+        Formats like .stl repeat the vertices of each face. The faces are
+        remapped to the merged vertices, and the colors and alphas of the
+        vertices, if any, follow them.
+
+        :param epsilon: vertices closer than epsilon may be merged, see
+        arrays.weld; with 0, only equal vertices are merged
+        """
+        vertices = self.get_array('vertices')
+        (kept, remap) = weld(vertices, epsilon)
 
-        for (index, face) in enumerate(faces):
+        if self.get_count('colors') == len(vertices):
+            self.set_array('colors', self.get_array('colors')[kept])
 
-            v1 = Vertex.from_points(self.vertices[face.a.vertex], self.vertices[face.b.vertex])
-            v2 = Vertex.from_points(self.vertices[face.a.vertex], self.vertices[face.c.vertex])
-            cross = Vertex.cross_product(v1, v2)
-            cross.normalize()
-            self.normals[index] = cross
+        if self.alphas is not None and len(self.alphas) == len(vertices):
+            self.alphas = self.alphas[kept]
 
-            face.a.normal = index
-            face.b.normal = index
-            face.c.normal = index
+        self.set_array('vertices', vertices[kept])
+
+        for part in self.parts:
+            part.set_index_array('vertex', remap[part.get_index_array('vertex')])
+
+    def add_material(self, material):
+        """Adds a material to the model
+
+        The materials are indexed by name, the first one of a name is the one
+        returned by get_material.
+
+        :param material: Material to add
+        """
+        self.material_indices.setdefault(material.name, len(self.materials))
+        self.materials.append(material)
 
     def get_material_index(self, material):
         """Finds the index of the given material
 
+        Raises KeyError if there is no material with this name.
+
         :param material: Material you want the index of
         """
-        return [i for (i,m) in enumerate(self.materials) if m.name == material.name][0]
+        index = self.material_indices.get(material.name)
+
+        # The list of materials may have been changed without add_material
+        if index is None or index >= len(self.materials) or self.materials[index].name != material.name:
+            self.material_indices = {}
+            for (i, m) in enumerate(self.materials):
+                self.material_indices.setdefault(m.name, i)
+            index = self.material_indices[material.name]
+
+        return index
+
+    def get_material(self, name):
+        """Finds a material by name, returns None if there is none
+
+        :param name: name of the material
+        """
+        try:
+            return self.materials[self.get_material_index(Material(name))]
+        except KeyError:
+            return None
 
 class TextModelParser(ModelParser):
     def parse_file(self, path):
@@ -321,14 +599,143 @@ class BoundingBox:
             abs(self.max_z - self.min_z))
 
 
+def _write_chunks(file, chunks):
+    """Writes chunks of strings or bytes in a file object opened in binary mode
+    """
+    for chunk in chunks:
+        file.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
+def _seekable(file):
+    """Checks whether a file object can be written at another position
+    """
+    try:
+        return file.seekable()
+    except (AttributeError, ValueError):
+        return False
+
 class Exporter:
     """Represents an object that can export a model into a certain format
+
+    Exporters generate the file chunk by chunk with their chunks method, each
+    chunk containing at most batch_size vertices or faces, so that the whole
+    file is never held in memory when it is written.
     """
+    batch_size = 16384
+    """Number of elements formatted in each chunk
+    """
+
     def __init__(self, model):
         """Creates a exporter for the model
 
         :param model: model to export
         """
         self.model = model
+        model.apply_transforms()
 
+    def write(self, file):
+        """Writes the exported model in a file
+
+        :param file: a file object opened in binary mode
+        """
+        _write_chunks(file, self.chunks())
+
+    def __str__(self):
+        """Exports the model as a string
 
+        Only text formats can be exported as a string, binary ones are
+        exported with bytes().
+        """
+        chunks = []
+
+        for chunk in self.chunks():
+            if not isinstance(chunk, str):
+                raise Exception('The ' + self.__class__.__name__ + ' writes a binary file, use bytes() instead of str()')
+            chunks.append(chunk)
+
+        return ''.join(chunks)
+
+    def __bytes__(self):
+        """Exports the model as bytes, in text or binary formats
+        """
+        return b''.join(chunk.encode() if isinstance(chunk, str) else chunk for chunk in self.chunks())
+
+    def batches(self, length):
+        """Generates the (begin, end) bounds of the batches of a sequence
+
+        :param length: number of elements of the sequence
+        """
+        for begin in range(0, length, self.batch_size):
+            yield (begin, min(begin + self.batch_size, length))
+
+class StreamableExporter(Exporter):
+    """Exporter of a format made of a header, the vertices and then the faces
+
+    Subclasses generate them with header(vertex_count, face_count), which
+    writes the counts of the model when they are None, and with
+    vertex_chunks(model) and face_chunks(model), which take the model of the
+    exporter or a piece generated by ModelParser.stream_file. They can then
+    write these pieces with write_stream.
+    """
+    count_width = 20
+    """Number of characters of the counts of the header written by
+    write_stream before the counts are known
+    """
+
+    def chunks(self):
+        """Generates the content of the exported file, as strings or bytes
+        """
+        yield self.header()
+        yield from self.vertex_chunks(self.model)
+        yield from self.face_chunks(self.model)
+
+    def write_stream(self, pieces, file):
+        """Writes the pieces of a model generated by ModelParser.stream_file
+
+        The vertices of all the pieces come before their faces, so the faces
+        are kept in a temporary file until the last piece is written. The
+        counts of the header are only known at the end: if the file is
+        seekable, the header is written with blank counts which are replaced
+        at the end, otherwise the vertices are also kept in a temporary file
+        and written after the header.
+
+        :param pieces: iterable of models, e.g. the generator of stream_file
+        :param file: a file object opened in binary mode
+        """
+        seekable = _seekable(file)
+        blank = ' ' * self.count_width
+        vertex_count = 0
+        face_count = 0
+
+        with tempfile.TemporaryFile() as faces, \
+             (contextlib.nullcontext(file) if seekable else tempfile.TemporaryFile()) as vertices:
+
+            if seekable:
+                start = file.tell()
+                header = self.header(blank, blank)
+                _write_chunks(file, [header])
+
+            for piece in pieces:
+                _write_chunks(vertices, self.vertex_chunks(piece))
+                _write_chunks(faces, self.face_chunks(piece))
+                vertex_count += piece.get_count('vertices')
+                face_count += piece.face_count()
+
+            vertex_count = str(vertex_count).ljust(self.count_width)
+            face_count = str(face_count).ljust(self.count_width)
+
+            if seekable:
+                # The header is written again over the first one
+                if len(self.header(blank, blank)) != len(header):
+                    raise Exception('The header changed while the stream was written')
+
+                faces.seek(0)
+                shutil.copyfileobj(faces, file, 1 << 20)
+                end = file.tell()
+                file.seek(start)
+                _write_chunks(file, [self.header(vertex_count, face_count)])
+                file.seek(end)
+            else:
+                _write_chunks(file, [self.header(vertex_count, face_count)])
+                for spooled in (vertices, faces):
+                    spooled.seek(0)
+                    shutil.copyfileobj(spooled, file, 1 << 20)
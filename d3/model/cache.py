@@ -0,0 +1,162 @@
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+
+from .tools import file_extension
+
+class ConversionCache:
+    """Directory of converted models, indexed by the content of their input
+
+    An entry is keyed by the hash of the input file, the format of the output,
+    the up conversion, the transform and the options of the exporter, so a
+    model converted again the same way, even from another path, is copied
+    from the cache instead of being parsed and exported. When the entries
+    exceed max_size bytes, the least recently used ones are removed.
+    """
+    def __init__(self, directory, max_size = 1 << 30):
+        """Creates a cache, and its directory if it does not exist
+
+        :param directory: path to the directory of the entries
+        :param max_size: maximum number of bytes of all the entries
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.digests = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def digest(self, input):
+        """Returns the hash of the content of a file
+
+        The hash is kept as long as the size and the modification time of the
+        file do not change.
+
+        :param input: path to the file
+        """
+        stat = os.stat(input)
+        signature = (stat.st_size, stat.st_mtime_ns)
+
+        if self.digests.get(input, (None, None))[0] != signature:
+            sha = hashlib.sha256()
+            with open(input, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+            self.digests[input] = (signature, sha.hexdigest())
+
+        return self.digests[input][1]
+
+    def key(self, input, output, up_conversion = None, options = {}, transform = None):
+        """Returns the key of the conversion of an input
+
+        :param input: path of the input model
+        :param output: path of the output, only its extension is used
+        :param up_conversion: conversion of the up vector
+        :param options: keyword arguments given to the exporter
+        :param transform: 4x4 matrix applied to the model, or None
+        """
+        extension = file_extension(output)
+        transform = transform.tolist() if transform is not None else None
+        conversion = repr((extension, up_conversion, sorted(options.items()), transform))
+        return hashlib.sha256((self.digest(input) + conversion).encode()).hexdigest() + extension
+
+    def path(self, key):
+        """Returns the path of the entry of a key
+
+        :param key: key returned by the key method
+        """
+        return os.path.join(self.directory, key)
+
+    def contains(self, key):
+        """Checks whether the cache has an entry for a key
+
+        :param key: key returned by the key method
+        """
+        return os.path.exists(self.path(key))
+
+    def size(self, key):
+        """Returns the number of bytes of the entry of a key
+
+        :param key: key returned by the key method, of an entry of the cache
+        """
+        return os.path.getsize(self.path(key))
+
+    def copy(self, key, file):
+        """Writes the entry of a key in a file object
+
+        Returns False if there is no entry for the key.
+
+        :param key: key returned by the key method
+        :param file: a file object opened in binary mode
+        """
+        try:
+            with open(self.path(key), 'rb') as f:
+                shutil.copyfileobj(f, file, 1 << 20)
+        except FileNotFoundError:
+            return False
+
+        # The modification time orders the entries for the eviction
+        try:
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            pass
+
+        return True
+
+    @contextlib.contextmanager
+    def storing(self, key, file):
+        """Context that gives a file object writing both in a file and in the cache
+
+        The entry is only added to the cache if the context exits without
+        error, so that an incomplete output is never cached.
+
+        :param key: key returned by the key method
+        :param file: a file object opened in binary mode
+        """
+        (descriptor, temporary) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+
+        try:
+            with os.fdopen(descriptor, 'wb') as entry:
+                yield _Tee(file, entry)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries while the cache is too big
+        """
+        entries = []
+
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        size = sum(entry[1] for entry in entries)
+
+        for (mtime, entry_size, name) in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+class _Tee:
+    """File object that writes in two file objects
+    """
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def write(self, bytes):
+        self.first.write(bytes)
+        self.second.write(bytes)
@@ -1,8 +1,13 @@
-from ..basemodel import TextModelParser, Exporter, Vertex, TexCoord, Normal, FaceVertex, Face
+from ..basemodel import TextModelParser, StreamableExporter, Vertex, TexCoord, Normal, Color, FaceVertex, Face
 from ..mesh import Material, MeshPart
+from ..arrays import np, format_rows, FLOAT_DTYPE, INDEX_DTYPE
 from functools import reduce
+from concurrent.futures import ProcessPoolExecutor
+import mmap
 import os.path
+import io
 import sys
+import warnings
 
 
 def is_obj(filename):
@@ -13,8 +18,352 @@ def is_obj(filename):
     """
     return filename[-4:] == '.obj'
 
+_SPACE = ord(' ')
+_TAB = ord('\t')
+_NEWLINE = ord('\n')
+_RETURN = ord('\r')
+_SLASH = ord('/')
+_HASH = ord('#')
+
+# Kinds of lines handled by the array reader
+_OTHER, _VERTEX, _TEX_COORD, _NORMAL, _FACE = range(5)
+
+def _select_lines(buffer, kinds, line_lengths, kind):
+    """Returns the bytes of all the lines of a certain kind
+
+    :param buffer: bytes of the file, as an array
+    :param kinds: kind of each line
+    :param line_lengths: number of bytes of each line, including the newline
+    :param kind: the kind of lines to select
+    """
+    return buffer[np.repeat(kinds == kind, line_lengths)]
+
+def _parse_elements(buffer, kinds, line_lengths, kind, size):
+    """Parses the v, vt or vn lines of a file
+
+    Returns a (N, width) array where width is the number of numbers on the
+    first line, or None if the lines could not be parsed.
+
+    :param buffer: bytes of the file, as an array
+    :param kinds: kind of each line
+    :param line_lengths: number of bytes of each line, including the newline
+    :param kind: the kind of lines to parse
+    :param size: minimum number of numbers on each line
+    """
+    text = _select_lines(buffer, kinds, line_lengths, kind).tobytes()
+
+    if len(text) == 0:
+        return np.empty((0, size), dtype=FLOAT_DTYPE)
+
+    width = len(text[:text.index(b'\n')].split()) - 1
+    if width < size:
+        return None
+
+    try:
+        return np.loadtxt(io.BytesIO(text), dtype=FLOAT_DTYPE, usecols=range(1, width + 1), ndmin=2)
+    except ValueError:
+        return None
+
+def _count_per_line(mask, line_starts):
+    """Counts the True values of a mask for each line
+
+    :param mask: array of booleans, one per byte
+    :param line_starts: index of the first byte of each line
+    """
+    if len(line_starts) == 0:
+        return np.zeros(0, dtype='int64')
+    return np.add.reduceat(mask.astype('int64'), line_starts)
+
+def _parse_faces(buffer, kinds, line_lengths):
+    """Parses the f lines of a file
+
+    Returns the indices, the number of face vertices on each line, the number
+    of slashes on each line and the number of double slashes on each line, or
+    None if the lines could not be parsed.
+
+    :param buffer: bytes of the file, as an array
+    :param kinds: kind of each line
+    :param line_lengths: number of bytes of each line, including the newline
+    """
+    text = _select_lines(buffer, kinds, line_lengths, _FACE)
+    lengths = line_lengths[kinds == _FACE]
+    line_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype('int64') if len(lengths) > 0 else lengths
+
+    # Remove the f keyword
+    text[line_starts] = _SPACE
+
+    slash = text == _SLASH
+    blank = (text == _SPACE) | (text == _TAB) | (text == _NEWLINE) | (text == _RETURN)
+    previous = np.concatenate([[True], blank[:-1]])
+    tokens = _count_per_line(~blank & previous, line_starts)
+    slashes = _count_per_line(slash, line_starts)
+    double_slashes = _count_per_line(slash & np.concatenate([slash[1:], [False]]), line_starts)
+
+    text[slash] = _SPACE
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        try:
+            values = np.fromstring(text.tobytes(), dtype='int64', sep=' ')
+        except (ValueError, DeprecationWarning):
+            return None
+
+    return values, tokens, slashes, double_slashes
+
+def parse_obj_bytes(data):
+    """Parses the geometry of a .obj file in bulk
+
+    The v, vt, vn and f lines are grouped by kind and converted to arrays all
+    at once. Polygons are split in triangle fans. The other lines are returned
+    as strings with their line number so that they can be parsed one by one.
+
+    Returns a dict containing the arrays, or None if the file is too irregular
+    for this reader, e.g. if the vertices have different numbers of
+    coordinates.
+
+    :param data: bytes of the .obj file
+    """
+    return merge_obj_chunks([parse_obj_chunk(data)])
+
+def parse_obj_chunk(data):
+    """Parses a chunk of consecutive lines of a .obj file in bulk
+
+    Like parse_obj_bytes, but the indices of the faces are not checked, and
+    the relative ones refer to the elements of the chunk: a mask of the
+    relative indices is returned so that merge_obj_chunks can shift them.
+
+    :param data: bytes of the lines of the chunk
+    """
+    buffer = np.frombuffer(data, dtype='uint8')
+
+    if len(buffer) == 0 or buffer[-1] != _NEWLINE:
+        buffer = np.concatenate([buffer, [_NEWLINE]]).astype('uint8')
+
+    line_ends = np.flatnonzero(buffer == _NEWLINE)
+    line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+    line_lengths = line_ends - line_starts + 1
+
+    padded = np.concatenate([buffer, [_NEWLINE, _NEWLINE]]).astype('uint8')
+    first = padded[line_starts]
+    second = padded[line_starts + 1]
+    third = padded[line_starts + 2]
+    second_blank = (second == _SPACE) | (second == _TAB)
+    third_blank = (third == _SPACE) | (third == _TAB)
+
+    kinds = np.full(len(line_starts), _OTHER, dtype='uint8')
+    kinds[(first == ord('v')) & second_blank] = _VERTEX
+    kinds[(first == ord('v')) & (second == ord('t')) & third_blank] = _TEX_COORD
+    kinds[(first == ord('v')) & (second == ord('n')) & third_blank] = _NORMAL
+    kinds[(first == ord('f')) & second_blank] = _FACE
+
+    # Inline comments are left to the line by line parser
+    hashes = np.flatnonzero(buffer == _HASH)
+    if np.any(np.repeat(kinds, line_lengths)[hashes] != _OTHER):
+        return None
+
+    result = {}
+
+    # Vertices, with an optional color and alpha after the coordinates
+    values = _parse_elements(buffer, kinds, line_lengths, _VERTEX, 3)
+    if values is None:
+        return None
+    result['vertices'] = np.ascontiguousarray(values[:, :3])
+    result['colors'] = np.ascontiguousarray(values[:, 3:6]) if values.shape[1] >= 6 else None
+    result['alphas'] = np.ascontiguousarray(values[:, 6]) if values.shape[1] >= 7 else None
+
+    # Texture coordinates and normals
+    for (kind, name, size) in [(_TEX_COORD, 'tex_coords', 2), (_NORMAL, 'normals', 3)]:
+        values = _parse_elements(buffer, kinds, line_lengths, kind, size)
+        if values is None:
+            return None
+        result[name] = np.ascontiguousarray(values[:, :size])
+
+    # Faces
+    parsed = _parse_faces(buffer, kinds, line_lengths)
+    if parsed is None:
+        return None
+    values, tokens, slashes, double_slashes = parsed
+
+    if len(tokens) > 0 and np.any(tokens < 3):
+        return None
+
+    # Every face vertex of the file must have the same form: v, v/t, v//n or v/t/n
+    per_vertex = slashes[0] // tokens[0] if len(tokens) > 0 else 0
+    if np.any(slashes != per_vertex * tokens) or per_vertex > 2:
+        return None
+    if np.any(double_slashes != 0) and (per_vertex != 2 or np.any(double_slashes != tokens)):
+        return None
+
+    double = len(tokens) > 0 and double_slashes[0] > 0
+    attributes = [['vertex'], ['vertex', 'tex_coord'], ['vertex', 'tex_coord', 'normal']][per_vertex]
+    if double:
+        attributes = ['vertex', 'normal']
+
+    if len(values) != len(attributes) * tokens.sum():
+        return None
+    values = values.reshape(-1, len(attributes))
+
+    # Relative indices refer to the elements defined before the face
+    face_lines = np.flatnonzero(kinds == _FACE)
+    kinds_of = {'vertex': _VERTEX, 'tex_coord': _TEX_COORD, 'normal': _NORMAL}
+    indices = {}
+    relative = {}
+    for (column, attribute) in enumerate(attributes):
+        index = values[:, column]
+        negative = index < 0
+        if np.any(negative):
+            defined_before = np.cumsum(kinds == kinds_of[attribute])[face_lines]
+            index = np.where(negative, index + np.repeat(defined_before, tokens), index - 1)
+            relative[attribute] = negative
+        else:
+            index = index - 1
+        if np.any(values[:, column] == 0):
+            return None
+        indices[attribute] = index
+
+    # Triangle fans 0 i i+1 for each 1 <= i < len - 1
+    triangles = tokens - 2
+    face_of_triangle = np.repeat(np.arange(len(tokens)), triangles)
+    offsets = np.concatenate([[0], np.cumsum(tokens)[:-1]]) if len(tokens) > 0 else tokens
+    triangle_starts = np.concatenate([[0], np.cumsum(triangles)[:-1]]) if len(tokens) > 0 else tokens
+    i = np.arange(len(face_of_triangle)) - triangle_starts[face_of_triangle] + 1
+    first_corner = offsets[face_of_triangle]
+    corners = np.stack([first_corner, first_corner + i, first_corner + i + 1], axis=1)
+
+    result['attributes'] = attributes if len(tokens) > 0 else None
+    result['faces'] = {}
+    result['relative'] = {}
+    for attribute in ['vertex', 'tex_coord', 'normal']:
+        if attribute in indices:
+            result['faces'][attribute] = indices[attribute][corners].astype(INDEX_DTYPE)
+        else:
+            result['faces'][attribute] = None
+        if attribute in relative:
+            result['relative'][attribute] = relative[attribute][corners]
+    result['face_lines'] = face_lines[face_of_triangle]
+    result['line_count'] = len(line_starts)
+
+    # The other lines, e.g. mtllib and usemtl, are parsed one by one
+    result['others'] = []
+    for line in np.flatnonzero(kinds == _OTHER):
+        string = data[line_starts[line]:line_ends[line]].decode().strip()
+        if string != '' and string[0] != '#':
+            if string.split()[0] in ('v', 'vt', 'vn', 'f'):
+                return None
+            result['others'].append((line, string))
+
+    return result
+
+def merge_obj_chunks(chunks):
+    """Merges the results of parse_obj_chunk on consecutive chunks of a file
+
+    The relative indices of each chunk are shifted by the number of elements
+    of the previous chunks, and all the indices are checked. Returns a dict
+    like parse_obj_bytes, or None if a chunk could not be parsed or if the
+    chunks are inconsistent, e.g. if only some of them have colors.
+
+    :param chunks: results of parse_obj_chunk, in the order of the file
+    """
+    if any(chunk is None for chunk in chunks):
+        return None
+
+    names = {'vertex': 'vertices', 'tex_coord': 'tex_coords', 'normal': 'normals'}
+    result = {}
+
+    for name in names.values():
+        result[name] = np.concatenate([chunk[name] for chunk in chunks])
+
+    for name in ('colors', 'alphas'):
+        values = [chunk[name] for chunk in chunks if len(chunk['vertices']) > 0]
+        if len(values) > 0 and all(value is not None for value in values):
+            result[name] = np.concatenate(values)
+        elif any(value is not None for value in values):
+            return None
+        else:
+            result[name] = None
+
+    # Every face vertex of the file must have the same form
+    forms = set(tuple(chunk['attributes']) for chunk in chunks if chunk['attributes'] is not None)
+    if len(forms) > 1:
+        return None
+    attributes = forms.pop() if len(forms) > 0 else ('vertex',)
+
+    offsets = dict.fromkeys(names, 0)
+    faces = dict((attribute, []) for attribute in attributes)
+    face_lines = []
+    result['others'] = []
+    line_offset = 0
+
+    for chunk in chunks:
+        if chunk['attributes'] is not None:
+            for attribute in attributes:
+                index = chunk['faces'][attribute]
+                if attribute in chunk['relative'] and offsets[attribute] > 0:
+                    index = np.where(chunk['relative'][attribute], index + offsets[attribute], index)
+                faces[attribute].append(index)
+
+        face_lines.append(chunk['face_lines'] + line_offset)
+        result['others'] += [(line + line_offset, string) for (line, string) in chunk['others']]
+
+        for (attribute, name) in names.items():
+            offsets[attribute] += len(chunk[name])
+        line_offset += chunk['line_count']
+
+    result['faces'] = {}
+    for attribute in names:
+        if attribute not in attributes:
+            result['faces'][attribute] = None
+            continue
+
+        index = np.concatenate(faces[attribute]) if len(faces[attribute]) > 0 else np.empty((0, 3), dtype=INDEX_DTYPE)
+        if np.any(index < 0) or np.any(index >= offsets[attribute]):
+            return None
+        result['faces'][attribute] = index
+
+    result['face_lines'] = np.concatenate(face_lines)
+
+    return result
+
+def _parse_obj_file_chunk(path, begin, end):
+    """Parses the lines of a .obj file between two offsets with parse_obj_chunk
+
+    Used by the processes of OBJParser.parse_file, which read their chunk
+    themselves instead of receiving it.
+
+    :param path: path to the .obj file
+    :param begin: offset of the first byte of the chunk
+    :param end: offset after the last byte of the chunk
+    """
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        return parse_obj_chunk(f.read(end - begin))
+
+def split_lines(data, count):
+    """Returns the offsets of about count chunks of data ending with a new line
+
+    :param data: bytes, or a buffer like a mmap
+    :param count: number of chunks wanted
+    """
+    bounds = [0]
+
+    for i in range(1, count):
+        end = data.find(b'\n', max(bounds[-1], len(data) * i // count)) + 1
+        if end == 0:
+            break
+        if end > bounds[-1]:
+            bounds.append(end)
+
+    if len(data) > bounds[-1]:
+        bounds.append(len(data))
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
 class OBJParser(TextModelParser):
     """Parser that parses a .obj file
+
+    The file is read with parse_obj_bytes, or in parallel chunks if processes
+    is set, and falls back to the line by line parser when the file is too
+    irregular.
     """
 
     def __init__(self, up_conversion = None):
@@ -23,6 +372,148 @@ class OBJParser(TextModelParser):
         self.mtl = None
         self.vertex_offset = 0
 
+    def parse_file(self, path):
+        """Sets the path of the model and parses it
+
+        :param path: path to the .obj file to parse
+        """
+        self.path = path
+
+        if self.processes is not None and self.processes > 1 and os.path.getsize(path) > 0:
+            result = self.parse_chunks(path)
+        else:
+            with open(path, 'rb') as f:
+                result = parse_obj_bytes(f.read())
+
+        if result is None:
+            return super().parse_file(path)
+
+        self.add_parsed_bytes(result)
+
+    def stream_file(self, path, chunk_size = 1 << 22):
+        """Generates the model of a .obj file piece by piece
+
+        Each piece is made of about chunk_size bytes of lines parsed with
+        parse_obj_chunk, so the file must be regular enough for it, and its
+        faces may only refer to elements defined before them.
+
+        :param path: path to the .obj file to parse
+        :param chunk_size: number of bytes read for each piece
+        """
+        self.path = path
+        transform = self.pending_transform
+        offsets = {'vertex': 0, 'tex_coord': 0, 'normal': 0}
+        beginning_of_line = b''
+        empty = True
+
+        with open(path, 'rb') as f:
+            for bytes in iter(lambda: f.read(chunk_size), b''):
+                bytes = beginning_of_line + bytes
+                end = bytes.rfind(b'\n') + 1
+                beginning_of_line = bytes[end:]
+
+                if end > 0:
+                    yield self.parse_piece(bytes[:end], offsets, transform)
+                    empty = False
+
+        if beginning_of_line != b'' or empty:
+            yield self.parse_piece(beginning_of_line, offsets, transform)
+
+    def parse_piece(self, data, offsets, transform):
+        """Empties the model and fills it with lines of the file, for stream_file
+
+        :param data: bytes of consecutive lines
+        :param offsets: number of vertices, texture coordinates and normals of
+        the previous pieces, updated with the ones of this piece
+        :param transform: the pending transform of the model, applied to the piece
+        """
+        result = parse_obj_chunk(data)
+
+        if result is None:
+            raise Exception('The lines of the .obj file are too irregular to be streamed')
+
+        names = {'vertex': 'vertices', 'tex_coord': 'tex_coords', 'normal': 'normals'}
+
+        for (attribute, name) in names.items():
+            index = result['faces'][attribute]
+            if index is None:
+                continue
+
+            if attribute in result['relative']:
+                index = np.where(result['relative'][attribute], index + offsets[attribute], index)
+            if np.any(index < 0) or np.any(index >= offsets[attribute] + len(result[name])):
+                raise Exception('The faces of the .obj file refer to elements defined after them, '
+                                'they cannot be streamed')
+
+            result['faces'][attribute] = index
+
+        for (attribute, name) in names.items():
+            offsets[attribute] += len(result[name])
+
+        self.clear()
+        self.add_parsed_bytes(result)
+        self.pending_transform = transform
+        self.apply_transforms()
+
+        return self
+
+    def parse_chunks(self, path):
+        """Parses chunks of the file in parallel with parse_obj_chunk
+
+        The file is split at line boundaries in as many chunks as processes,
+        each process reads and parses its chunk, and the results are merged
+        with merge_obj_chunks.
+
+        :param path: path to the .obj file to parse
+        """
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            bounds = split_lines(data, self.processes)
+
+        with ProcessPoolExecutor(self.processes) as executor:
+            chunks = executor.map(_parse_obj_file_chunk, [path] * len(bounds), *zip(*bounds))
+            return merge_obj_chunks(list(chunks))
+
+    def add_parsed_bytes(self, result):
+        """Adds the arrays returned by parse_obj_bytes to the model
+
+        :param result: the dict returned by parse_obj_bytes
+        """
+        self.set_array('vertices', result['vertices'])
+        if result['colors'] is not None:
+            self.set_array('colors', result['colors'])
+        self.alphas = result['alphas']
+        if len(result['tex_coords']) > 0:
+            self.set_array('tex_coords', result['tex_coords'])
+        if len(result['normals']) > 0:
+            self.set_array('normals', result['normals'])
+
+        faces = result['faces']
+        face_lines = result['face_lines']
+        added = 0
+
+        for (line, string) in result['others']:
+            if string.split()[0] == 'usemtl':
+                end = np.searchsorted(face_lines, line)
+                self.add_face_slice(faces, added, end)
+                added = end
+            self.parse_line(string)
+
+        self.add_face_slice(faces, added, len(face_lines))
+
+    def add_face_slice(self, faces, begin, end):
+        """Adds some of the triangles returned by parse_obj_bytes with the current material
+
+        :param faces: dict of the index arrays of the triangles
+        :param begin: index of the first triangle to add
+        :param end: index after the last triangle to add
+        """
+        if begin == end:
+            return
+
+        self.add_face_array(*[faces[attribute][begin:end] if faces[attribute] is not None else None
+                              for attribute in ('vertex', 'tex_coord', 'normal')],
+                            material=self.current_material)
+
     def parse_line(self, string):
         """Parses a line of .obj file
 
@@ -46,6 +537,9 @@ class OBJParser(TextModelParser):
                 print('Warning : ' + path + ' not found ', file=sys.stderr)
         elif first == 'v':
             self.add_vertex(Vertex().from_array(split))
+            # Some exporters write the vertex color after its coordinates
+            if len(split) >= 6:
+                self.add_color(Color().from_array(split[3:6]))
         elif first == 'vn':
             self.add_normal(Normal().from_array(split))
         elif first == 'vt':
@@ -83,7 +577,7 @@ class OBJParser(TextModelParser):
                 # First, lets compute all the FaceVertex for each vertex
                 face_vertices = []
                 for face_vertex in splits[:]:
-                    face_vertices.append(FaceVertex(*face_vertex))
+                    face_vertices.append(FaceVertex().from_array(face_vertex))
 
                 # Then, we build the faces 0 i i+1 for each 1 <= i < len - 1
                 for i in range(1, len(face_vertices) - 1):
@@ -124,7 +618,7 @@ class MTLParser:
 
         if first == 'newmtl':
             self.current_mtl = Material(' '.join(split[:]))
-            self.parent.materials.append(self.current_mtl)
+            self.parent.add_material(self.current_mtl)
         elif first == 'Ka':
             self.current_mtl.Ka = Vertex().from_array(split)
         elif first == 'Kd':
@@ -143,12 +637,10 @@ class MTLParser:
                 self.parse_line(line)
 
     def __getitem__(self, key):
-        for material in self.parent.materials:
-            if material.name == key:
-                return material
+        return self.parent.get_material(key)
 
 
-class OBJExporter(Exporter):
+class OBJExporter(StreamableExporter):
     """Exporter to .obj format
     """
 
@@ -158,51 +650,93 @@ class OBJExporter(Exporter):
         :param model: Model to export
         """
         super().__init__(model)
+        self.current_material = ''
+
+    def chunks(self):
+        """Exports the model chunk by chunk
+        """
+        self.current_material = ''
+        yield from self.vertex_chunks(self.model)
+        yield from self.face_chunks(self.model)
+
+    def write_stream(self, pieces, file):
+        """Writes the pieces of a model generated by ModelParser.stream_file
+
+        The lines of the vertices and of the faces of each piece are written
+        one piece after the other, since faces may be defined anywhere after
+        their vertices in a .obj file.
+        """
+        self.current_material = ''
+
+        for piece in pieces:
+            for chunk in self.vertex_chunks(piece):
+                file.write(chunk.encode())
+            for chunk in self.face_chunks(piece):
+                file.write(chunk.encode())
 
-    def __str__(self):
-        """Exports the model
+    def vertex_chunks(self, model):
+        """Exports the vertices, texture coordinates and normals of a model chunk by chunk
         """
-        current_material = ''
-        string = ""
-
-        for vertex in self.model.vertices:
-            string += "v " + ' '.join([str(vertex.x), str(vertex.y), str(vertex.z)]) + "\n"
-
-        string += "\n"
-
-        if len(self.model.tex_coords) > 0:
-            for tex_coord in self.model.tex_coords:
-                string += "vt " + ' '.join([str(tex_coord.x), str(tex_coord.y)]) + "\n"
-
-            string += "\n"
-
-        if len(self.model.normals) > 0:
-            for normal in self.model.normals:
-                string += "vn " + ' '.join([str(normal.x), str(normal.y), str(normal.z)]) + "\n"
-
-            string += "\n"
-
-        faces = sum(map(lambda x: x.faces, self.model.parts), [])
-
-        for face in faces:
-            if face.material is not None and face.material.name != current_material:
-                current_material = face.material.name
-                string += "usemtl " + current_material + "\n"
-            string += "f "
-            arr = []
-            for v in [face.a, face.b, face.c]:
-                sub_arr = []
-                sub_arr.append(str(v.vertex + 1))
-                if v.normal is None:
-                    if v.tex_coord is not None:
-                        sub_arr.append('')
-                        sub_arr.append(str(v.tex_coord + 1))
-                elif v.tex_coord is not None:
-                    sub_arr.append(str(v.tex_coord + 1))
-                    if v.normal is not None:
-                        sub_arr.append(str(v.normal + 1))
-                arr.append('/'.join(sub_arr))
-
-            string += ' '.join(arr) + '\n'
-        return string
+        vertices = model.get_array('vertices')
+        colors = model.get_array('colors')
+        colors = colors if len(colors) == len(vertices) and len(colors) > 0 else None
+        alphas = model.alphas
+        alphas = alphas[:, np.newaxis] if colors is not None and alphas is not None and len(alphas) == len(vertices) else None
+
+        for (begin, end) in self.batches(len(vertices)):
+            if alphas is not None:
+                rows = format_rows(vertices[begin:end], colors[begin:end], alphas[begin:end])
+            elif colors is not None:
+                rows = format_rows(vertices[begin:end], colors[begin:end])
+            else:
+                rows = format_rows(vertices[begin:end])
+            yield ''.join(['v ' + row + '\n' for row in rows])
+
+        yield "\n"
+
+        for (name, keyword) in [('tex_coords', 'vt '), ('normals', 'vn ')]:
+            array = model.get_array(name)
+
+            if len(array) > 0:
+                for (begin, end) in self.batches(len(array)):
+                    yield ''.join([keyword + row + '\n' for row in format_rows(array[begin:end])])
+
+                yield "\n"
+
+    def face_chunks(self, model):
+        """Exports the faces of a model chunk by chunk, with the materials of their parts
+        """
+        # The faces that do not have texture coordinates or normals have -1
+        # indices, and are written without them
+        batches = model.face_batches(('vertex', 'tex_coord', 'normal'), self.batch_size, partial=True)
+
+        for (runs, (vertex, tex_coord, normal)) in batches:
+            corners = []
+
+            # Indices start at 1 in .obj files
+            for i in range(3):
+                strings = [str(index + 1) for index in vertex[:, i].tolist()]
+                textured = tex_coord[:, i].tolist() if tex_coord is not None else [-1] * len(strings)
+
+                if tex_coord is not None:
+                    strings = [a + '/' + str(b + 1) if b >= 0 else a for (a, b) in zip(strings, textured)]
+
+                if normal is not None:
+                    strings = [a + ('/' if t >= 0 else '//') + str(b + 1) if b >= 0 else a
+                               for (a, t, b) in zip(strings, textured, normal[:, i].tolist())]
+
+                corners.append(strings)
+
+            lines = ['f ' + ' '.join(face) + '\n' for face in zip(*corners)]
+            output = []
+            begin = 0
+
+            for (part, count) in runs:
+                if part.material is not None and part.material.name != self.current_material:
+                    self.current_material = part.material.name
+                    output.append("usemtl " + self.current_material + "\n")
+
+                output += lines[begin:begin + count]
+                begin += count
 
+            yield ''.join(output)
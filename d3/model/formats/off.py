@@ -1,5 +1,6 @@
-from ..basemodel import TextModelParser, Exporter, Vertex, TexCoord, Normal, FaceVertex, Face
+from ..basemodel import TextModelParser, StreamableExporter, Vertex, TexCoord, Normal, FaceVertex, Face
 from ..mesh import Material, MeshPart
+from ..arrays import format_rows
 
 def is_off(filename):
     """Checks that the file is a .off file
@@ -39,9 +40,10 @@ class OFFParser(TextModelParser):
 
 
 
-class OFFExporter(Exporter):
+class OFFExporter(StreamableExporter):
     """Exporter to .off format
     """
+
     def __init__(self, model):
         """Creates an exporter from the model
 
@@ -49,17 +51,23 @@ class OFFExporter(Exporter):
         """
         super().__init__(model)
 
-    def __str__(self):
-        """Exports the model
+    def header(self, vertex_count = None, face_count = None):
+        """Returns the header of the .off file
         """
-        faces = sum(map(lambda x: x.faces, self.model.parts), [])
-        string = "OFF\n{} {} {}".format(len(self.model.vertices), len(faces), 0) + '\n'
-
-        for vertex in self.model.vertices:
-            string += ' '.join([str(vertex.x), str(vertex.y), str(vertex.z)]) + '\n'
+        vertex_count = vertex_count if vertex_count is not None else self.model.get_count('vertices')
+        face_count = face_count if face_count is not None else self.model.face_count()
+        return "OFF\n{} {} {}".format(vertex_count, face_count, 0) + '\n'
 
-        for face in faces:
-            string += '3 ' + ' '.join([str(face.a.vertex), str(face.b.vertex), str(face.c.vertex)]) + '\n'
+    def vertex_chunks(self, model):
+        """Exports the vertices of a model chunk by chunk
+        """
+        vertices = model.get_array('vertices')
 
-        return string
+        for (begin, end) in self.batches(len(vertices)):
+            yield ''.join([row + '\n' for row in format_rows(vertices[begin:end])])
 
+    def face_chunks(self, model):
+        """Exports the faces of a model chunk by chunk
+        """
+        for (runs, (vertex,)) in model.face_batches(('vertex',), self.batch_size):
+            yield ''.join(['3 ' + row + '\n' for row in format_rows(vertex)])
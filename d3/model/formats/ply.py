@@ -1,7 +1,10 @@
+import itertools
 import os
 import sys
 import struct
-from ..basemodel import ModelParser, TextModelParser, Exporter, Vertex, Face, Color, FaceVertex, TexCoord, Material
+from ..basemodel import ModelParser, StreamableExporter, Material
+from ..arrays import np, format_rows, quantize_colors, FLOAT_DTYPE, INDEX_DTYPE
+from numpy.lib.recfunctions import structured_to_unstructured
 
 class UnkownTypeError(Exception):
     def __init__(self, message):
@@ -15,67 +18,160 @@ def is_ply(filename):
     """
     return filename[-4:] == '.ply'
 
-# List won't work with this function
-def _ply_type_size(type):
-    """Returns the size of a ply property
+PLY_TYPES = {
+    'char': 'i1', 'uchar': 'u1', 'short': 'i2', 'ushort': 'u2',
+    'int': 'i4', 'uint': 'u4', 'float': 'f4', 'double': 'f8',
+    'int8': 'i1', 'uint8': 'u1', 'int16': 'i2', 'uint16': 'u2',
+    'int32': 'i4', 'uint32': 'u4', 'float32': 'f4', 'float64': 'f8',
+}
+"""numpy types of the ply types
+"""
 
-    :param type: a string that is in a ply element
+def _numpy_type(type, byteorder):
+    """Returns the numpy type of a ply type
+
+    :param type: a ply type that is not a list
+    :param byteorder: < for little endian, > for big endian
     """
-    if type == 'char' or type == 'uchar':
-        return 1
-    elif type == 'short' or type == 'ushort':
-        return 2
-    elif type == 'int' or type == 'uint':
-        return 4
-    elif type == 'float':
-        return 4
-    elif type == 'double':
-        return 8
-    else:
+    if type not in PLY_TYPES:
         raise UnkownTypeError('Type ' + type + ' is unknown')
+    return np.dtype(byteorder + PLY_TYPES[type])
 
-def ply_type_size(type):
-    """Returns the list containing the sizes of the elements
+def _concatenate(arrays):
+    """Concatenates arrays, without copying when there is only one
 
-    :param type: a string that is in a ply element
+    :param arrays: list of arrays
     """
-    split = type.split()
-
-    if len(split) == 1:
-        return [_ply_type_size(type)]
-    else:
-        if split[0] != 'list':
-            print('You have multiple types but it\'s not a list...', file=sys.stderr)
-            sys.exit(-1)
-        else:
-            return list(map(lambda a: _ply_type_size(a), split[1:]))
+    return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
 
+def _fields(records, names):
+    """Returns some fields of a list of record arrays as a (N, len(names)) array
 
-def bytes_to_element(type, bytes, byteorder = 'little'):
-    """Returns a python object parsed from bytes
+    When there is a single record array, which is the case of the vertices
+    of a binary file, and the fields are contiguous and of the same type,
+    the result is a view on the records and nothing is copied.
 
-    :param type: the type of the object to parse
-    :param bytes: the bytes to read
-    :param byteorder: little or big endian
+    :param records: list of numpy record arrays
+    :param names: names of the fields
     """
-    if type == 'char':
-        return ord(struct.unpack('<b', bytes)[0])
-    if type == 'uchar':
-        return ord(struct.unpack('<c', bytes)[0])
-    elif type == 'short':
-        return struct.unpack('<h', bytes)[0]
-    elif type == 'ushort':
-        return struct.unpack('<H', bytes)[0]
-    elif type == 'int':
-        return struct.unpack('<i', bytes)[0]
-    elif type == 'uint':
-        return struct.unpack('<I', bytes)[0]
-    elif type == 'float':
-        return struct.unpack('<f', bytes)[0]
-    elif type == 'double':
-        return struct.unpack('<d', bytes)[0]
-    else:
-        raise UnkownTypeError('Type ' + type + ' is unknown')
+    arrays = [structured_to_unstructured(r[names], copy=False) for r in records]
+    return _concatenate(arrays).astype(FLOAT_DTYPE, copy=False)
+
+def add_vertex_records(model, records):
+    """Adds the decoded vertex records of a .ply file to a model
+
+    :param model: the model to fill
+    :param records: list of numpy record arrays of the vertex element
+    """
+    if len(records) == 0:
+        return
+
+    names = records[0].dtype.names
+
+    model.set_array('vertices', _fields(records, ['x', 'y', 'z']))
+
+    if 'red' in names:
+        model.set_array('colors', _fields(records, ['red', 'green', 'blue']) / 255)
+
+    if 'alpha' in names:
+        model.alphas = _fields(records, ['alpha'])[:, 0] / 255
+
+    if 'nx' in names:
+        model.set_array('normals', _fields(records, ['nx', 'ny', 'nz']))
+
+def _fan(array):
+    """Splits (N, k) polygons in triangle fans, giving a (N * (k - 2), 3) array
+
+    :param array: one row per polygon
+    """
+    k = array.shape[1]
+    if k == 3:
+        return array
+    return np.stack([array[:, [0, i, i + 1]] for i in range(1, k - 1)], axis=1).reshape(-1, 3)
+
+def _fan_runs(runs):
+    """Splits runs of polygons in triangle fans, keeping the order of the runs
+
+    The runs with the same number of corners are split together, so that a
+    mesh that alternates triangles and quads takes a few numpy calls.
+
+    :param runs: non empty list of (N, k) arrays of polygons, k may differ
+    between runs
+    """
+    corners = np.array([r.shape[1] for r in runs])
+    triangles = np.array([len(r) for r in runs]) * (corners - 2)
+
+    if (corners == corners[0]).all():
+        return _fan(_concatenate(runs))
+
+    starts = np.cumsum(triangles) - triangles
+    result = None
+
+    for k in np.unique(corners).tolist():
+        selected = np.flatnonzero(corners == k)
+        fans = _fan(np.concatenate([runs[i] for i in selected.tolist()]))
+
+        # Index of each triangle of the fans in the result
+        shifts = starts[selected] - (np.cumsum(triangles[selected]) - triangles[selected])
+        targets = np.repeat(shifts, triangles[selected]) + np.arange(len(fans))
+
+        if result is None:
+            result = np.empty((triangles.sum(), 3), dtype=fans.dtype)
+        result[targets] = fans
+
+    return result
+
+def add_face_records(model, records):
+    """Adds the decoded face records of a .ply file to a model
+
+    Polygons are split in triangle fans, and the faces are grouped in parts by
+    their texnumber.
+
+    :param model: the model to fill
+    :param records: list of numpy record arrays of the face element
+    """
+    vertex = []
+    tex_coord = []
+    material = []
+    tex_coords = []
+    tex_coord_count = 0
+
+    for r in records:
+        names = r.dtype.names
+        indices = r['vertex_indices' if 'vertex_indices' in names else 'vertex_index'].reshape(len(r), -1)
+        vertex.append(indices)
+        triangles = indices.shape[1] - 2
+
+        if 'texcoord' in names:
+            uv = r['texcoord'].reshape(-1, 2)
+            tex_coords.append(uv)
+            tex_coord.append(tex_coord_count + np.arange(len(uv)).reshape(len(r), -1))
+            tex_coord_count += len(uv)
+
+        if 'texnumber' in names:
+            material.append(np.repeat(r['texnumber'], triangles))
+
+    if len(vertex) == 0:
+        return
+
+    vertex = _fan_runs(vertex).astype(INDEX_DTYPE, copy=False)
+    tex_coord = _fan_runs(tex_coord).astype(INDEX_DTYPE, copy=False) if len(tex_coord) == len(records) else None
+
+    if tex_coord is not None:
+        model.set_array('tex_coords', _concatenate(tex_coords).astype(FLOAT_DTYPE, copy=False))
+
+    if len(material) != len(records):
+        default = model.materials[0] if len(model.materials) == 1 else None
+        model.add_face_array(vertex, tex_coord, material=default)
+        return
+
+    # One part for each run of faces with the same material
+    material = _concatenate(material)
+    bounds = [0] + (np.flatnonzero(np.diff(material)) + 1).tolist() + [len(material)]
+    for (begin, end) in zip(bounds[:-1], bounds[1:]):
+        model.add_face_array(vertex[begin:end],
+                             tex_coord[begin:end] if tex_coord is not None else None,
+                             material=model.materials[material[begin]])
 
 class PLYParser(ModelParser):
     """Parser that parses a .ply file
@@ -86,31 +182,140 @@ class PLYParser(ModelParser):
         self.counter = 0
         self.elements = []
         self.inner_parser = PLYHeaderParser(self)
-        self.beginning_of_line = ''
+        self.beginning_of_line = b''
         self.header_finished = False
+        # Set by stream_file, which takes the records of the content parser
+        # instead of adding them to the model at the end
+        self.streaming = False
+
+    def stream_file(self, path, chunk_size = 1 << 20):
+        """Generates the model of a .ply file piece by piece
+
+        Each piece has the vertices or the faces decoded from a chunk of
+        chunk_size bytes of the file. The texture coordinates of the faces
+        cannot be streamed, since they are indexed in each piece.
+
+        :param path: path to the file to parse
+        :param chunk_size: number of bytes read for each piece
+        """
+        self.path = path
+        self.streaming = True
+        transform = self.pending_transform
+        empty = True
+
+        with open(path, 'rb') as f:
+            for bytes in iter(lambda: f.read(chunk_size), b''):
+                self.parse_bytes(bytes, 0)
+
+                for piece in self.take_pieces(transform):
+                    yield piece
+                    empty = False
+
+        if self.header_finished:
+            self.inner_parser.finish()
+
+            for piece in self.take_pieces(transform):
+                yield piece
+                empty = False
+
+        if empty:
+            self.clear()
+            yield self
+
+    def take_pieces(self, transform):
+        """Generates the records decoded by the content parser as pieces, for stream_file
+
+        :param transform: the pending transform of the model, applied to the pieces
+        """
+        if not self.header_finished:
+            return
+
+        records = self.inner_parser.records
+        self.inner_parser.records = {}
+
+        for index in sorted(records):
+            element = self.elements[index]
+
+            if element.name not in ('vertex', 'face'):
+                continue
+
+            self.clear()
+
+            if element.name == 'vertex':
+                add_vertex_records(self, records[index])
+            elif any('texcoord' in r.dtype.names for r in records[index]):
+                raise Exception('The texture coordinates of .ply files cannot be streamed')
+            else:
+                add_face_records(self, records[index])
+
+            self.pending_transform = transform
+            self.apply_transforms()
+            yield self
+
+    def parse_file(self, path, chunk_size = 1 << 20):
+        """Parses a .ply file
+
+        If memory_map is set, the file is mapped in memory and the elements
+        of a binary file are decoded as views on the map.
+
+        :param path: path to the file to parse
+        :param chunk_size: size of the chunks when the file is not mapped
+        """
+        if not self.memory_map:
+            super().parse_file(path, chunk_size)
+        else:
+            buffer = self.map_file(path)
+            end = self.parse_header(buffer)
+
+            if end is not None:
+                self.inner_parser.parse_buffer(buffer, end)
+
+        if self.header_finished:
+            self.inner_parser.finish()
+
+    def parse_header(self, bytes):
+        """Parses the header if the bytes contain all of it
+
+        Returns the index of the first byte of the content, or None if the
+        line end_header is not in the bytes yet.
+
+        :param bytes: the beginning of the file
+        """
+        end = bytes.find(b'end_header')
+        if end == -1:
+            return None
+
+        end = bytes.find(b'\n', end)
+        if end == -1:
+            return None
+
+        for line in bytes[:end].decode().splitlines():
+            if line.strip() != '':
+                self.inner_parser.parse_line(line.strip())
+
+        self.header_finished = True
+        return end + 1
 
     def parse_bytes(self, bytes, byte_counter):
         """Parses bytes of a .ply file
+
+        The bytes of the header are kept until the line end_header is found,
+        the rest is given to the parser of the content.
         """
         if self.header_finished:
-            self.inner_parser.parse_bytes(self.beginning_of_line + bytes, byte_counter - len(self.beginning_of_line))
-            self.beginning_of_line = b''
+            self.inner_parser.parse_bytes(bytes, byte_counter)
             return
 
-        # Build lines for header and use PLYHeaderParser
-        current_line = self.beginning_of_line
-        for (i, c) in enumerate(bytes):
-            char = chr(c)
-            if char == '\n':
-                self.inner_parser.parse_line(current_line)
-                if  current_line == 'end_header':
-                    self.header_finished = True
-                    self.beginning_of_line = bytes[i+1:]
-                    return
-                current_line = ''
-            else:
-                current_line += chr(c)
-        self.beginning_of_line = current_line
+        bytes = self.beginning_of_line + bytes
+        byte_counter -= len(self.beginning_of_line)
+        end = self.parse_header(bytes)
+
+        if end is None:
+            self.beginning_of_line = bytes
+            return
+
+        self.beginning_of_line = b''
+        self.inner_parser.parse_bytes(bytes[end:], byte_counter + end)
 
 class PLYHeaderParser:
     """Parser that parses the header of a .ply file
@@ -153,7 +358,7 @@ class PLYHeaderParser:
 
         elif split[0] == 'comment' and split[1] == 'TextureFile':
             material = Material('mat' + str(len(self.parent.materials)))
-            self.parent.materials.append(material)
+            self.parent.add_material(material)
             material.relative_path_to_texture = split[2]
             material.absolute_path_to_texture = os.path.join(os.path.dirname(self.parent.path), split[2])
 
@@ -162,333 +367,630 @@ class PLYElement:
         self.name = name
         self.number = number
         self.properties = []
+        self.dtypes = {}
+        self.layouts = {}
 
     def add_property(self, name, type):
         self.properties.append((name, type))
 
-class PLY_ASCII_ContentParser:
-    def __init__(self, parent):
-        self.parent = parent
-        self.element_index = 0
-        self.counter = 0
-        self.current_element = None
-        self.beginning_of_line = ''
+    def layout(self, byteorder):
+        """Returns how to find the lengths of the lists in a record
 
-    def parse_bytes(self, bytes, byte_counter):
-        current_line = self.beginning_of_line
-        for (i, c) in enumerate(bytes):
-            char = chr(c)
-            if char == '\n':
-                self.parse_line(current_line)
-                current_line = ''
-            else:
-                current_line += chr(c)
-        self.beginning_of_line = current_line
+        The layout is a list with a (skipped, count, item) tuple for each list
+        property, where skipped is the size of the properties before it that
+        are not lists, count the struct of its length and item the size of
+        its values.
 
+        :param byteorder: < for little endian, > for big endian
+        """
+        if byteorder not in self.layouts:
+            layout = []
+            skipped = 0
 
-    def parse_line(self, string):
+            for (name, type) in self.properties:
+                split = type.split()
 
-        if string == '':
-            return
+                if split[0] != 'list':
+                    skipped += _numpy_type(type, byteorder).itemsize
+                    continue
 
-        if self.current_element is None:
-            self.current_element = self.parent.elements[0]
+                count = struct.Struct(byteorder + _numpy_type(split[1], byteorder).char)
+                layout.append((skipped, count, _numpy_type(split[2], byteorder).itemsize))
+                skipped = 0
 
-        split = string.split()
-        color = None
+            self.layouts[byteorder] = layout
 
-        if self.current_element.name == 'vertex':
+        return self.layouts[byteorder]
 
-            vertex = Vertex()
-            red = None
-            blue = None
-            green = None
-            alpha = None
+    def record_lengths(self, buffer, offset, byteorder):
+        """Returns the lengths of the lists of the record that begins at offset
 
-            offset = 0
-            for property in self.current_element.properties:
+        Returns None if the buffer is too short to read them.
 
-                if property[0] == 'x':
-                    vertex.x = float(split[offset])
-                elif property[0] == 'y':
-                    vertex.y = float(split[offset])
-                elif property[0] == 'z':
-                    vertex.z = float(split[offset])
-                elif property[0] == 'red':
-                    red = float(split[offset]) / 255
-                elif property[0] == 'green':
-                    green = float(split[offset]) / 255
-                elif property[0] == 'blue':
-                    blue = float(split[offset]) / 255
-                elif property[0] == 'alpha':
-                    alpha = float(split[offset]) / 255
+        :param buffer: the bytes of the content of the file
+        :param offset: index of the first byte of the record
+        :param byteorder: < for little endian, > for big endian
+        """
+        lengths = []
+        position = offset
 
-                offset += 1
+        for (skipped, count, item) in self.layout(byteorder):
+            position += skipped
 
-            self.parent.add_vertex(vertex)
+            if position + count.size > len(buffer):
+                return None
 
-            if red is not None:
-                color = Color(red, blue, green)
-                self.parent.add_color(color)
+            length = count.unpack_from(buffer, position)[0]
+            lengths.append(length)
+            position += count.size + length * item
 
-        elif self.current_element.name == 'face':
+        return lengths
 
-            faceVertexArray = []
-            current_material = None
+    def text_dtype(self, tokens):
+        """Returns the numpy type of the record written in a line of text
 
-            # Analyse element
-            offset = 0
-            for property in self.current_element.properties:
+        The lengths of the list properties are read in the values of the line,
+        as in record_lengths.
 
-                if property[0] == 'vertex_indices':
-                    for i in range(int(split[offset])):
-                        faceVertexArray.append(FaceVertex(int(split[i+offset+1])))
-                    offset += int(split[0]) + 1
+        :param tokens: the values of the line
+        """
+        lengths = []
+        position = 0
 
-                elif property[0] == 'texcoord':
-                    offset += 1
-                    for i in range(3):
-                        # Create corresponding tex_coords
-                        tex_coord = TexCoord().from_array(split[offset:offset+2])
-                        offset += 2
-                        self.parent.add_tex_coord(tex_coord)
-                        faceVertexArray[i].tex_coord = len(self.parent.tex_coords) - 1
+        for (name, type) in self.properties:
+            if type.split()[0] != 'list':
+                position += 1
+                continue
 
-                elif property[0] == 'texnumber':
-                    current_material = self.parent.materials[int(split[offset])]
-                    offset += 1
+            length = int(tokens[position])
+            lengths.append(length)
+            position += 1 + length
 
-            face = Face(*faceVertexArray)
-            face.material = current_material
-            self.parent.add_face(face)
+        return self.dtype(lengths, '=')
 
-        self.counter += 1
+    def dtype(self, lengths, byteorder):
+        """Returns the numpy type of the records whose lists have given lengths
 
-        if self.counter == self.current_element.number:
-            self.next_element()
+        :param lengths: the length of each list property
+        :param byteorder: < for little endian, > for big endian, = for native
+        """
+        key = (byteorder,) + tuple(lengths)
 
-    def next_element(self):
-        self.element_index += 1
-        if self.element_index < len(self.parent.elements):
-            self.current_element = self.parent.elements[self.element_index]
+        if key not in self.dtypes:
+            fields = []
+            lengths = iter(lengths)
 
-class PLYLittleEndianContentParser:
-    def __init__(self, parent):
-        self.parent = parent
-        self.previous_bytes = b''
-        self.element_index = 0
-        self.counter = 0
-        self.current_element = None
-        self.started = False
+            for (name, type) in self.properties:
+                split = type.split()
 
-        # Serves for debugging purposes
-        # self.current_byte = 0
+                if split[0] != 'list':
+                    fields.append((name, _numpy_type(type, byteorder)))
+                else:
+                    fields.append((name + ' count', _numpy_type(split[1], byteorder)))
+                    fields.append((name, _numpy_type(split[2], byteorder), (next(lengths),)))
 
-    def parse_bytes(self, bytes, byte_counter):
+            self.dtypes[key] = np.dtype(fields)
 
-        if not self.started:
-            # self.current_byte = byte_counter
-            self.started = True
+        return self.dtypes[key]
 
-        if self.current_element is None:
-            self.current_element = self.parent.elements[0]
+    def runs(self, buffer, offset, count, byteorder):
+        """Finds the runs of records whose lists have the same lengths
 
-        bytes = self.previous_bytes + bytes
-        current_byte_index = 0
+        The records are walked once. The first records of a run are checked
+        one by one, and the end of a longer run is searched in bulk, in windows
+        of growing size, so that what is read past it is at most about as long
+        as the run. Only the complete records of the buffer are counted.
+        Returns a list of (dtype, count) tuples, one per run.
 
-        while True:
-            property_values = []
+        :param buffer: the bytes of the content of the file
+        :param offset: index of the first byte of the records
+        :param count: maximum number of records
+        :param byteorder: < for little endian, > for big endian
+        """
+        runs = []
 
-            beginning_byte_index = current_byte_index
+        while count > 0:
+            lengths = self.record_lengths(buffer, offset, byteorder)
 
-            for property in self.current_element.properties:
+            if lengths is None:
+                break
 
-                size = ply_type_size(property[1])
+            dtype = self.dtype(lengths, byteorder)
+            available = min(count, (len(buffer) - offset) // dtype.itemsize)
 
-                if current_byte_index + size[0] > len(bytes):
-                    self.previous_bytes = bytes[beginning_byte_index:]
-                    # self.current_byte -= len(self.previous_bytes)
-                    return
+            if available == 0:
+                break
 
-                if len(size) == 1:
+            length = 1
+            while length < min(available, SHORT_RUN) and \
+                    self.record_lengths(buffer, offset + length * dtype.itemsize, byteorder) == lengths:
+                length += 1
 
-                    size = size[0]
+            if length == SHORT_RUN:
+                length = _run_length(buffer, offset, available, dtype, length)
 
-                    current_property_bytes = bytes[current_byte_index:current_byte_index+size]
-                    property_values.append(bytes_to_element(property[1], current_property_bytes))
-                    current_byte_index += size
-                    # self.current_byte += size
+            runs.append((dtype, length))
+            offset += length * dtype.itemsize
+            count -= length
 
-                elif len(size) == 2:
+        return runs
 
-                    types = property[1].split()[1:]
-                    current_property_bytes = bytes[current_byte_index:current_byte_index+size[0]]
-                    number_of_elements = bytes_to_element(types[0], current_property_bytes)
-                    current_byte_index += size[0]
-                    # self.current_byte += size[0]
+    def decode(self, buffer, offset, count, byteorder, copy = True):
+        """Decodes as many records as possible from a buffer
 
-                    property_values.append([])
+        Each run of records whose lists have the same lengths, e.g. all the
+        faces of a triangle mesh, is decoded in bulk. Returns a list of record
+        arrays, one per run, which is empty if the buffer does not contain a
+        complete record.
 
-                    # Parse list
-                    for i in range(number_of_elements):
+        :param buffer: the bytes of the content of the file
+        :param offset: index of the first byte to decode
+        :param count: maximum number of records to decode
+        :param byteorder: < for little endian, > for big endian
+        :param copy: if False, the records are views on the buffer
+        """
+        runs = self.runs(buffer, offset, count, byteorder)
+        size = sum(dtype.itemsize * number for (dtype, number) in runs)
 
-                        if current_byte_index + size[1] > len(bytes):
+        if copy:
+            # One copy of the bytes of all the runs
+            buffer = bytes(memoryview(buffer)[offset:offset + size])
+            offset = 0
 
-                            self.previous_bytes = bytes[beginning_byte_index:]
-                            # self.current_byte -= len(self.previous_bytes)
-                            return
+        records = []
 
-                        current_property_bytes = bytes[current_byte_index:current_byte_index+size[1]]
-                        property_values[-1].append(bytes_to_element(types[1], current_property_bytes))
-                        current_byte_index += size[1]
-                        # self.current_byte += size[1]
+        for (dtype, number) in runs:
+            records.append(np.frombuffer(buffer, dtype, number, offset))
+            offset += dtype.itemsize * number
 
+        return records
 
-                else:
-                    print('I have not idea what this means', file=sys.stderr)
+    def decode_lines(self, lines):
+        """Decodes lines of text
 
-            # Add element
-            if self.current_element.name == 'vertex':
+        As in decode, the records are returned as a list of arrays, one per run
+        of records whose lists have the same lengths. The lines are grouped by
+        these lengths, and each group is decoded with a single call to loadtxt.
 
-                vertex = Vertex()
-                red = None
-                green = None
-                blue = None
-                alpha = None
-                offset = 0
+        :param lines: non empty lines of an ascii file, as bytes
+        """
+        lists = sum(type.split()[0] == 'list' for (name, type) in self.properties)
+        bounds = [0, len(lines)]
+
+        if lists == 1:
+            # The number of values of a line gives the length of its list
+            keys = np.fromiter(map(len, map(bytes.split, lines)), dtype='int64', count=len(lines))
+            bounds = [0] + (np.flatnonzero(np.diff(keys)) + 1).tolist() + [len(lines)]
+        elif lists > 1:
+            dtypes = {}
+            keys = np.array([dtypes.setdefault(self.text_dtype(line.split()), len(dtypes)) for line in lines])
+            bounds = [0] + (np.flatnonzero(np.diff(keys)) + 1).tolist() + [len(lines)]
+
+        if len(bounds) == 2:
+            return [np.loadtxt(lines, dtype=self.text_dtype(lines[0].split()), ndmin=1)]
+
+        # Records of each group, in the order of the lines
+        groups = {}
+        for key in np.unique(keys).tolist():
+            selected = np.flatnonzero(keys == key).tolist()
+            dtype = self.text_dtype(lines[selected[0]].split())
+            groups[key] = [np.loadtxt([lines[i] for i in selected], dtype=dtype, ndmin=1), 0]
+
+        records = []
+
+        for (begin, end) in zip(bounds[:-1], bounds[1:]):
+            group = groups[int(keys[begin])]
+            records.append(group[0][group[1]:group[1] + end - begin])
+            group[1] += end - begin
+
+        return records
+
+SHORT_RUN = 8
+"""Number of records whose lengths are checked one by one before the end of
+their run is searched in bulk
+"""
+
+def _run_length(buffer, offset, count, dtype, checked):
+    """Returns the number of records at offset whose lists have the same
+    lengths as the first one, at most count
+
+    :param buffer: the bytes of the content of the file
+    :param offset: index of the first byte of the records
+    :param count: number of complete records of type dtype in the buffer
+    :param dtype: type of the first record, see PLYElement.dtype
+    :param checked: number of first records known to have the same lengths
+    """
+    names = [name for name in dtype.names if name.endswith(' count')]
 
-                for property in self.current_element.properties:
+    if len(names) == 0:
+        return count
 
-                    if property[0] == 'x':
-                        vertex.x = property_values[offset]
-                    elif property[0] == 'y':
-                        vertex.y = property_values[offset]
-                    elif property[0] == 'z':
-                        vertex.z = property_values[offset]
-                    elif property[0] == 'red':
-                        red = property_values[offset] / 255
-                    elif property[0] == 'green':
-                        green = property_values[offset] / 255
-                    elif property[0] == 'blue':
-                        blue = property_values[offset] / 255
-                    elif property[0] == 'alpha':
-                        alpha = property_values[offset] / 255
+    first = np.frombuffer(buffer, dtype, 1, offset)[0]
+    window = checked
 
-                    offset += 1
+    while checked < count:
+        end = min(count, checked + window)
+        records = np.frombuffer(buffer, dtype, end - checked, offset + checked * dtype.itemsize)
+        different = np.zeros(len(records), dtype=bool)
 
-                self.parent.add_vertex(vertex)
+        for name in names:
+            different |= records[name] != first[name]
 
-                if red is not None:
-                    self.parent.add_color(Color(red, blue, green))
+        if different.any():
+            return checked + int(np.argmax(different))
 
-            elif self.current_element.name == 'face':
+        checked = end
+        window *= 2
 
-                vertex_indices = []
-                tex_coords = []
-                material = None
+    return count
 
-                for (i, property) in enumerate(self.current_element.properties):
+class PLYLittleEndianContentParser:
+    """Parser that parses the content of a binary_little_endian .ply file
 
-                    if property[0] == 'vertex_indices':
-                        vertex_indices.append(property_values[i][0])
-                        vertex_indices.append(property_values[i][1])
-                        vertex_indices.append(property_values[i][2])
+    The bytes are decoded in bulk with numpy: each element is read as arrays
+    of records, one per run of records whose lists have the same lengths,
+    whose type is compiled from the header (see PLYElement.runs). The model
+    is filled once every element is read.
+    """
+    byteorder = '<'
 
-                    elif property[0] == 'texcoord':
-                        # Create texture coords
-                        for j in range(0,6,2):
-                            tex_coord = TexCoord(*property_values[i][j:j+2])
-                            tex_coords.append(tex_coord)
+    def __init__(self, parent):
+        self.parent = parent
+        self.buffer = bytearray()
+        self.element_index = 0
+        self.counter = 0
+        self.records = {}
 
-                    elif property[0] == 'texnumber':
-                        material = self.parent.materials[property_values[i]]
+    def parse_bytes(self, bytes, byte_counter):
+        """Decodes all the complete records contained in the bytes
 
-                for tex_coord in tex_coords:
-                    self.parent.add_tex_coord(tex_coord)
+        The bytes of an incomplete record are kept for the next call.
+        """
+        self.buffer += bytes
+        offset = 0
 
-                face = Face(*list(map(lambda x: FaceVertex(x), vertex_indices)))
+        while self.element_index < len(self.parent.elements):
 
-                counter = 3
-                if len(tex_coords) > 0:
-                    for face_vertex in [face.a, face.b, face.c]:
-                        face_vertex.tex_coord = len(self.parent.tex_coords) - counter
-                        counter -= 1
+            element = self.parent.elements[self.element_index]
 
-                if material is None and len(self.parent.materials) == 1:
-                    material = self.parent.materials[0]
+            if self.counter == element.number:
+                self.next_element()
+                if self.element_index == len(self.parent.elements):
+                    self.add_to_model()
+                continue
 
-                face.material = material
+            records = element.decode(self.buffer, offset, element.number - self.counter, self.byteorder)
 
-                self.parent.add_face(face)
+            if len(records) == 0:
+                break
 
-            self.counter += 1
+            self.records.setdefault(self.element_index, []).extend(records)
+            self.counter += sum(map(len, records))
+            offset += sum(r.nbytes for r in records)
 
-            if self.counter == self.current_element.number:
-                self.next_element()
+        del self.buffer[:offset]
+
+    def parse_buffer(self, buffer, offset):
+        """Decodes the whole content of the file from a buffer
+
+        The records are views on the buffer, nothing is copied.
+
+        :param buffer: a buffer containing the whole file, e.g. a mmap
+        :param offset: index of the first byte after the header
+        """
+        for (index, element) in enumerate(self.parent.elements):
+            records = element.decode(buffer, offset, element.number, self.byteorder, copy=False)
+            self.records[index] = records
+            offset += sum(r.nbytes for r in records)
+
+            # Truncated file
+            if sum(map(len, records)) < element.number:
+                break
+
+        self.element_index = len(self.parent.elements)
+        self.add_to_model()
 
     def next_element(self):
         self.counter = 0
         self.element_index += 1
+
+    def finish(self):
+        """Adds the records to the model if the file was truncated
+        """
         if self.element_index < len(self.parent.elements):
-            self.current_element = self.parent.elements[self.element_index]
+            self.element_index = len(self.parent.elements)
+            self.add_to_model()
+
+    def add_to_model(self):
+        """Adds the decoded vertices and faces to the model
+        """
+        if self.parent.streaming:
+            return
 
+        for (index, element) in enumerate(self.parent.elements):
+            if element.name == 'vertex':
+                add_vertex_records(self.parent, self.records.get(index, []))
+            elif element.name == 'face':
+                add_face_records(self.parent, self.records.get(index, []))
 
 
 class PLYBigEndianContentParser(PLYLittleEndianContentParser):
+    """Parser that parses the content of a binary_big_endian .ply file
+
+    The records are decoded the same way as the little endian ones, only the
+    byte order of their numpy type changes.
+    """
+    byteorder = '>'
+
+class PLY_ASCII_ContentParser(PLYLittleEndianContentParser):
+    """Parser that parses the content of an ascii .ply file
+
+    The bytes are split in lines in bulk, and the lines of each element are
+    decoded with numpy into the same records as the ones of a binary file
+    (see PLYElement.decode_lines). A partial line at the end of the bytes is
+    kept for the next call.
+    """
     def __init__(self, parent):
-        super().__init__(self, parent)
+        super().__init__(parent)
+        self.beginning_of_line = b''
+
+    def parse_bytes(self, bytes, byte_counter):
+        """Decodes all the complete lines contained in the bytes
+        """
+        bytes = self.beginning_of_line + bytes
+        end = bytes.rfind(b'\n') + 1
+        self.beginning_of_line = bytes[end:]
+        self.parse_lines(bytes[:end].split(b'\n'))
+
+    def parse_buffer(self, buffer, offset):
+        """Decodes the whole content of the file from a buffer
 
-    def parse_bytes(self, bytes):
-        # Reverse bytes, and then
-        super().parse_bytes(self, bytes)
+        :param buffer: a buffer containing the whole file, e.g. a mmap
+        :param offset: index of the first byte after the header
+        """
+        self.parse_lines(buffer[offset:].split(b'\n'))
+        self.finish()
+
+    def finish(self):
+        """Decodes the last line if it does not end with a new line
+        """
+        self.parse_lines([self.beginning_of_line])
+        self.beginning_of_line = b''
+        super().finish()
+
+    def parse_lines(self, lines):
+        """Decodes lines of the content
+
+        :param lines: lines as bytes, the empty ones are ignored
+        """
+        lines = [line for line in lines if not line.isspace() and line != b'']
+        position = 0
 
-class PLYExporter(Exporter):
-    def __init__(self, model):
+        while self.element_index < len(self.parent.elements):
+
+            element = self.parent.elements[self.element_index]
+
+            if self.counter == element.number:
+                self.next_element()
+                if self.element_index == len(self.parent.elements):
+                    self.add_to_model()
+                continue
+
+            if position == len(lines):
+                break
+
+            count = min(element.number - self.counter, len(lines) - position)
+            records = element.decode_lines(lines[position:position + count])
+
+            self.records.setdefault(self.element_index, []).extend(records)
+            self.counter += count
+            position += count
+
+PLY_FORMATS = {'ascii': None, 'binary_little_endian': '<', 'binary_big_endian': '>'}
+"""Formats of .ply files, with the byte order of their binary content
+"""
+
+class PLYExporter(StreamableExporter):
+    def __init__(self, model, colors = True, normals = False, format = 'ascii', alpha = True):
+        """Creates an exporter from the model
+
+        The colors are rounded to the nearest byte, and clamped to [0, 255].
+
+        :param model: Model to export
+        :param colors: whether the vertex colors of the model, if any, are
+        written as uchar red, green and blue properties
+        :param alpha: whether the alphas of the model, if any, are written as
+        an uchar alpha property with the colors
+        :param normals: whether the vertex normals of the model, if any, are
+        written as float nx, ny and nz properties
+        :param format: ascii, binary_little_endian or binary_big_endian
+        """
         super().__init__(model)
 
-    def __str__(self):
+        if format not in PLY_FORMATS:
+            raise ValueError('Unknown ply format ' + format)
+
+        self.options = (colors, normals, alpha)
+        (self.colors, self.normals, self.alpha) = self.vertex_properties(model)
+        self.format = format
+        self.byteorder = PLY_FORMATS[format]
 
-        faces = sum([part.faces for part in self.model.parts], [])
+    def vertex_properties(self, model):
+        """Returns whether the colors, the normals and the alphas of the vertices
+        of a model are written, as a (colors, normals, alpha) tuple
 
-        # Header
-        string = "ply\nformat ascii 1.0\ncomment Automatically gnerated by model-converter\n"
+        :param model: the model of the exporter, or a piece of stream_file
+        """
+        (colors, normals, alpha) = self.options
+        vertex_count = model.get_count('vertices')
+        colors = colors and model.get_count('colors') > 0 and model.get_count('colors') == vertex_count
+        normals = normals and model.get_count('normals') > 0 and model.get_count('normals') == vertex_count
+        alpha = colors and alpha and model.alphas is not None and len(model.alphas) == vertex_count
+        return (colors, normals, alpha)
+
+    def header(self, vertex_count = None, face_count = None):
+        """Returns the header of the .ply file
+        """
+        vertex_count = vertex_count if vertex_count is not None else self.model.get_count('vertices')
+        face_count = face_count if face_count is not None else self.model.face_count()
+
+        string = "ply\nformat " + self.format + " 1.0\ncomment Automatically gnerated by model-converter\n"
 
         for material in self.model.materials:
             string += "comment TextureFile " + (material.relative_path_to_texture or 'None') + "\n"
 
         # Types : vertices
-        string += "element vertex " + str(len(self.model.vertices)) +"\n"
+        string += "element vertex " + str(vertex_count) +"\n"
         string += "property float x\nproperty float y\nproperty float z\n"
 
+        if self.normals:
+            string += "property float nx\nproperty float ny\nproperty float nz\n"
+
+        if self.colors:
+            string += "property uchar red\nproperty uchar green\nproperty uchar blue\n"
+
+        if self.alpha:
+            string += "property uchar alpha\n"
+
         # Types : faces
-        string += "element face " + str(len(faces)) + "\n"
+        string += "element face " + str(face_count) + "\n"
         string += "property list uchar int vertex_indices\n"
 
-        if len(self.model.tex_coords) > 0:
+        if self.model.get_count('tex_coords') > 0:
             string += "property list uchar float texcoord\n"
             string += "property int texnumber\n"
 
         # End header
         string += "end_header\n"
 
-        # Content of the model
-        for vertex in self.model.vertices:
-            string += str(vertex.x) + " " + str(vertex.y) + " " + str(vertex.z) + "\n"
+        return string
 
-        for face in faces:
-            string += "3 " + str(face.a.vertex) + " " + str(face.b.vertex) + " " + str(face.c.vertex)
+    def vertex_dtype(self):
+        """Returns the numpy type of a vertex record of a binary file
+        """
+        fields = [('position', self.byteorder + 'f4', (3,))]
 
-            if len(self.model.tex_coords) > 0:
-                string += " 6 " \
-                       + str(self.model.tex_coords[face.a.tex_coord].x) + " " \
-                       + str(self.model.tex_coords[face.a.tex_coord].y) + " " \
-                       + str(self.model.tex_coords[face.b.tex_coord].x) + " " \
-                       + str(self.model.tex_coords[face.b.tex_coord].y) + " " \
-                       + str(self.model.tex_coords[face.c.tex_coord].x) + " " \
-                       + str(self.model.tex_coords[face.c.tex_coord].y) + " " \
-                       + str(self.model.get_material_index(face.material))
+        if self.normals:
+            fields.append(('normal', self.byteorder + 'f4', (3,)))
 
-            string += "\n"
+        if self.colors:
+            fields.append(('color', 'u1', (4 if self.alpha else 3,)))
 
-        return string
+        return np.dtype(fields)
+
+    def face_dtype(self):
+        """Returns the numpy type of a face record of a binary file
+        """
+        fields = [('count', 'u1'), ('vertex', self.byteorder + 'i4', (3,))]
 
+        if self.model.get_count('tex_coords') > 0:
+            fields += [('tex_coord_count', 'u1'), ('tex_coord', self.byteorder + 'f4', (6,)),
+                       ('material', self.byteorder + 'i4')]
+
+        return np.dtype(fields)
+
+    def write_stream(self, pieces, file):
+        """Writes the pieces of a model generated by ModelParser.stream_file
+
+        The properties of the vertices are the ones of the first piece that
+        has vertices or faces, e.g. not the one of a mtllib line, and the
+        other pieces must have the same. The pieces before it have nothing to
+        write. No piece may have texture coordinates, whose indices would
+        refer to the ones of other pieces.
+        """
+        pieces = self.check_pieces(pieces)
+
+        # The header is written before the pieces, with their properties
+        for piece in pieces:
+            if piece.get_count('vertices') > 0 or piece.face_count() > 0:
+                pieces = itertools.chain([piece], pieces)
+                break
+
+        super().write_stream(pieces, file)
+
+    def check_pieces(self, pieces):
+        """Generates the pieces, checking that they can be written in a stream
+
+        The vertex properties are set from the first piece that has vertices
+        or faces.
+        """
+        first = True
+
+        for piece in pieces:
+            if piece.get_count('tex_coords') > 0:
+                raise Exception('Texture coordinates cannot be streamed to .ply files')
+
+            if piece.get_count('vertices') > 0 or piece.face_count() > 0:
+                properties = self.vertex_properties(piece)
+
+                if first:
+                    (self.colors, self.normals, self.alpha) = properties
+                    first = False
+                elif piece.get_count('vertices') > 0 and properties != (self.colors, self.normals, self.alpha):
+                    raise Exception('The vertices of the stream do not all have the same properties')
+
+            yield piece
+
+    def vertex_chunks(self, model):
+        """Exports the vertices of a model chunk by chunk
+        """
+        vertices = model.get_array('vertices')
+
+        if self.normals:
+            normals = model.get_array('normals')
+
+        if self.colors:
+            colors = model.get_array('colors')
+            if self.alpha:
+                colors = np.column_stack([colors, model.alphas])
+            colors = quantize_colors(colors)
+
+        if self.byteorder is not None:
+            records = np.empty(min(self.batch_size, len(vertices)), dtype=self.vertex_dtype())
+
+        for (begin, end) in self.batches(len(vertices)):
+            if self.byteorder is not None:
+                batch = records[:end - begin]
+                batch['position'] = vertices[begin:end]
+                if self.normals:
+                    batch['normal'] = normals[begin:end]
+                if self.colors:
+                    batch['color'] = colors[begin:end]
+                yield batch.tobytes()
+                continue
+
+            arrays = [vertices[begin:end]]
+            if self.normals:
+                arrays.append(normals[begin:end])
+            if self.colors:
+                arrays.append(colors[begin:end])
+            yield ''.join([row + '\n' for row in format_rows(*arrays)])
+
+    def face_chunks(self, model):
+        """Exports the faces of a model chunk by chunk
+        """
+        tex_coords = model.get_array('tex_coords')
+
+        for (runs, (vertex, tex_coord)) in model.face_batches(('vertex', 'tex_coord'), self.batch_size):
+            if len(tex_coords) > 0:
+                material = np.repeat([model.get_material_index(part.material) for (part, count) in runs],
+                                     [count for (part, count) in runs]).astype('int32').reshape(-1, 1)
+
+            if self.byteorder is not None:
+                batch = np.empty(len(vertex), dtype=self.face_dtype())
+                batch['count'] = 3
+                batch['vertex'] = vertex
+                if len(tex_coords) > 0:
+                    batch['tex_coord_count'] = 6
+                    batch['tex_coord'] = tex_coords[tex_coord].reshape(-1, 6)
+                    batch['material'] = material[:, 0]
+                yield batch.tobytes()
+                continue
+
+            rows = format_rows(vertex)
+
+            if len(tex_coords) > 0:
+                tex_rows = format_rows(tex_coords[tex_coord].reshape(-1, 6), material)
+                yield ''.join(['3 ' + row + ' 6 ' + tex_row + '\n' for (row, tex_row) in zip(rows, tex_rows)])
+            else:
+                yield ''.join(['3 ' + row + '\n' for row in rows])
@@ -1,7 +1,21 @@
 from ..basemodel import TextModelParser, Exporter, Vertex, FaceVertex, Face
 from ..mesh import MeshPart
+from ..arrays import np, format_rows, face_normals, FLOAT_DTYPE, INDEX_DTYPE
 
-import os.path
+import os
+import struct
+
+STL_RECORD = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+"""Type of the 50 bytes records of the triangles of a binary .stl file
+"""
+
+STL_HEADER_SIZE = 84
+"""Size of the header of a binary .stl file, with the number of triangles
+"""
+
+STL_FORMATS = ['ascii', 'binary']
+"""Formats of .stl files
+"""
 
 def is_stl(filename):
     """Checks that the file is a .stl file
@@ -11,6 +25,24 @@ def is_stl(filename):
     """
     return filename[-4:] == '.stl'
 
+def is_binary_stl(header, size):
+    """Checks whether a .stl file is binary
+
+    A file is binary if its size is the one given by its number of triangles,
+    or if it does not begin with solid like an ASCII file.
+
+    :param header: the first 84 bytes of the file
+    :param size: the size of the file
+    """
+    if len(header) < STL_HEADER_SIZE:
+        return False
+
+    count = struct.unpack('<I', header[80:STL_HEADER_SIZE])[0]
+    if STL_HEADER_SIZE + count * STL_RECORD.itemsize == size:
+        return True
+
+    return not header.lstrip().startswith(b'solid')
+
 class STLParser(TextModelParser):
     """Parser that parses a .stl file
     """
@@ -23,6 +55,76 @@ class STLParser(TextModelParser):
         self.current_face = None
         self.face_vertices = None
 
+    def parse_file(self, path):
+        """Parses a binary or ASCII .stl file
+
+        The triangles of a binary file are decoded in bulk with numpy, from a
+        map of the file if memory_map is set. Like in ASCII files, the normals
+        of the file are ignored.
+
+        :param path: path to the file to parse
+        """
+        with open(path, 'rb') as f:
+            header = f.read(STL_HEADER_SIZE)
+            size = os.fstat(f.fileno()).st_size
+
+        if not is_binary_stl(header, size):
+            return super().parse_file(path)
+
+        count = struct.unpack('<I', header[80:STL_HEADER_SIZE])[0]
+        count = min(count, (size - STL_HEADER_SIZE) // STL_RECORD.itemsize)
+
+        if self.memory_map:
+            records = np.frombuffer(self.map_file(path), STL_RECORD, count, STL_HEADER_SIZE)
+        else:
+            self.path = path
+            records = np.fromfile(path, STL_RECORD, count, offset=STL_HEADER_SIZE)
+
+        self.add_records(records)
+
+    def stream_file(self, path, batch_size = 1 << 16):
+        """Generates the model of a .stl file piece by piece
+
+        The triangles of a binary file are read batch_size at a time. An
+        ASCII file is parsed as a single piece.
+
+        :param path: path to the file to parse
+        :param batch_size: number of triangles of each piece
+        """
+        with open(path, 'rb') as f:
+            header = f.read(STL_HEADER_SIZE)
+            size = os.fstat(f.fileno()).st_size
+
+            if not is_binary_stl(header, size):
+                yield from super().stream_file(path)
+                return
+
+            self.path = path
+            transform = self.pending_transform
+            count = struct.unpack('<I', header[80:STL_HEADER_SIZE])[0]
+            count = min(count, (size - STL_HEADER_SIZE) // STL_RECORD.itemsize)
+
+            # An empty file is still one piece
+            for begin in range(0, max(count, 1), batch_size):
+                records = np.frombuffer(f.read(min(batch_size, count - begin) * STL_RECORD.itemsize), STL_RECORD)
+
+                self.clear()
+                self.add_records(records, 3 * begin)
+                self.pending_transform = transform
+                self.apply_transforms()
+                yield self
+
+    def add_records(self, records, first = 0):
+        """Adds the triangles of a binary .stl file to the model
+
+        Each triangle has its own three vertices.
+
+        :param records: array of STL_RECORD
+        :param first: index of the first vertex of the records in the file
+        """
+        self.set_array('vertices', records['vertices'].reshape(-1, 3).astype(FLOAT_DTYPE, copy=False))
+        self.add_face_array(np.arange(first, first + 3 * len(records), dtype=INDEX_DTYPE).reshape(-1, 3))
+
     def parse_line(self, string):
         """Parses a line of .stl file
 
@@ -75,42 +177,52 @@ class STLParser(TextModelParser):
                     self.face_vertices = None
 
 
+FACET = "facet normal {}\n\touter loop\n\t\tvertex {}\n\t\tvertex {}\n\t\tvertex {}\n\tendloop\nendfacet\n"
+"""Template of a face in an ASCII .stl file
+"""
+
 class STLExporter(Exporter):
     """Exporter to .stl format
     """
-    def __init__(self, model):
+    def __init__(self, model, format = 'ascii'):
         """Creates an exporter from the model
 
         :param model: Model to export
+        :param format: ascii or binary
         """
         super().__init__(model)
-        super().__init__(model)
 
-    def __str__(self):
-        """Exports the model
-        """
-        string = 'solid {}\n'.format(os.path.basename(self.model.path[:-4]))
+        if format not in STL_FORMATS:
+            raise ValueError('Unknown stl format ' + format)
 
-        self.model.generate_face_normals()
+        self.format = format
 
-        faces = sum(map(lambda x: x.faces, self.model.parts), [])
+    def chunks(self):
+        """Exports the model chunk by chunk
 
-        for face in faces:
+        The normals of the faces are computed from their vertices.
+        """
+        name = os.path.basename(self.model.path[:-4])
+        vertices = self.model.get_array('vertices')
+        batches = self.model.face_batches(('vertex',), self.batch_size)
+
+        if self.format == 'binary':
+            yield name.encode()[:80].ljust(80, b' ') + struct.pack('<I', self.model.face_count())
 
-            n  = self.model.normals[face.a.normal]
-            v1 = self.model.vertices[face.a.vertex]
-            v2 = self.model.vertices[face.b.vertex]
-            v3 = self.model.vertices[face.c.vertex]
+            for (runs, (faces,)) in batches:
+                records = np.zeros(len(faces), dtype=STL_RECORD)
+                records['normal'] = face_normals(vertices, faces)
+                records['vertices'] = vertices[faces]
+                yield records.tobytes()
+
+            return
 
-            string += "facet normal {} {} {}\n".format(n.x, n.y, n.z)
+        yield 'solid {}\n'.format(name)
 
-            string += "\touter loop\n"
-            string += "\t\tvertex {} {} {}\n".format(v1.x, v1.y, v1.z)
-            string += "\t\tvertex {} {} {}\n".format(v2.x, v2.y, v2.z)
-            string += "\t\tvertex {} {} {}\n".format(v3.x, v3.y, v3.z)
+        for (runs, (faces,)) in batches:
+            normal_rows = format_rows(face_normals(vertices, faces))
+            vertex_rows = format_rows(vertices[faces.ravel()])
 
-            string += "\tendloop\n"
-            string += "endfacet\n"
+            yield ''.join([FACET.format(n, *vertex_rows[3 * i:3 * i + 3]) for (i, n) in enumerate(normal_rows)])
 
-        string += 'endsolid {}'.format(os.path.basename(self.model.path[:-4]))
-        return string
+        yield 'endsolid {}'.format(name)
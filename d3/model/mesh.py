@@ -32,15 +32,21 @@ class Material:
         # If no map_Kd, nothing to do
         if self.im is None:
 
-            if self.absolute_path_to_texture is None:
+            if self.absolute_path_to_texture is None and self is not Material.DEFAULT_MATERIAL:
                 return
 
+            # PIL is only imported when a texture is needed
             try:
                 import PIL.Image
-                self.im = PIL.Image.open(self.absolute_path_to_texture)
             except ImportError:
                 return
 
+            if self.absolute_path_to_texture is None:
+                # The default material is a white texture
+                self.im = PIL.Image.new("RGBA", (1,1), "white")
+            else:
+                self.im = PIL.Image.open(self.absolute_path_to_texture)
+
         try:
             ix, iy, image = self.im.size[0], self.im.size[1], self.im.tobytes("raw", "RGBA", 0, -1)
         except:
@@ -81,14 +87,12 @@ Material.DEFAULT_MATERIAL.Ka = 1.0
 Material.DEFAULT_MATERIAL.Kd = 0.0
 Material.DEFAULT_MATERIAL.Ks = 0.0
 
-try:
-    import PIL.Image
-    Material.DEFAULT_MATERIAL.im = PIL.Image.new("RGBA", (1,1), "white")
-except ImportError:
-    pass
-
 class MeshPart:
     """A part of a 3D model that is bound to a single material
+
+    The faces are a list of Face, or (F, 3) arrays of indices when the parser
+    filled them with add_face_array. The list of Face is then only built when
+    the faces are accessed.
     """
     def __init__(self, parent):
         """Creates a mesh part
@@ -101,7 +105,128 @@ class MeshPart:
         self.tex_coord_vbo = None
         self.normal_vbo = None
         self.color_vbo = None
-        self.faces = []
+        self._faces = []
+        self._index_arrays = None
+        self._partial = set()
+
+    @property
+    def faces(self):
+        """List of the Face of this MeshPart
+        """
+        if self._faces is None:
+            from .basemodel import Face, FaceVertex
+
+            material = self.material if self.material is not Material.DEFAULT_MATERIAL else None
+            columns = []
+            for attribute in ('vertex', 'tex_coord', 'normal'):
+                array = self._index_arrays[attribute]
+                column = array.tolist() if array is not None else None
+                if attribute in self._partial:
+                    # The faces without this attribute have -1 indices
+                    column = [[index if index >= 0 else None for index in row] for row in column]
+                columns.append(column)
+
+            self._faces = []
+            for i in range(len(columns[0])):
+                face_vertices = []
+                for j in range(3):
+                    face_vertices.append(FaceVertex(*[column[i][j] if column is not None else None for column in columns]))
+                self._faces.append(Face(*face_vertices, material=material))
+
+            self._index_arrays = None
+
+        return self._faces
+
+    @faces.setter
+    def faces(self, faces):
+        self._faces = faces
+        self._index_arrays = None
+
+    def get_index_array(self, attribute = 'vertex', partial = False):
+        """Returns the indices of the faces as a (F, 3) array
+
+        Returns None if the faces do not all have this attribute.
+
+        :param attribute: vertex, tex_coord or normal
+        :param partial: if some faces have the attribute, returns the array
+        with -1 indices for the others instead of None
+        """
+        if self._index_arrays is None:
+            from numpy import array
+            from .arrays import INDEX_DTYPE
+
+            self._index_arrays = {}
+            self._partial = set()
+            for name in ('vertex', 'tex_coord', 'normal'):
+                rows = [(getattr(face.a, name), getattr(face.b, name), getattr(face.c, name)) for face in self._faces]
+                try:
+                    self._index_arrays[name] = array(rows, dtype=INDEX_DTYPE).reshape(-1, 3)
+                except TypeError:
+                    if all(index is None for row in rows for index in row):
+                        self._index_arrays[name] = None
+                    else:
+                        rows = [[index if index is not None else -1 for index in row] for row in rows]
+                        self._index_arrays[name] = array(rows, dtype=INDEX_DTYPE)
+                        self._partial.add(name)
+
+            self._faces = None
+
+        if attribute in self._partial and not partial:
+            return None
+
+        return self._index_arrays[attribute]
+
+    def set_index_array(self, attribute, array):
+        """Replaces the indices of the faces by a (F, 3) array
+
+        :param attribute: vertex, tex_coord or normal
+        :param array: the new indices, or None
+        """
+        self.get_index_array()
+        self._index_arrays[attribute] = array
+        self._partial.discard(attribute)
+
+    def add_face_array(self, vertex, tex_coord = None, normal = None):
+        """Adds faces given as (F, 3) arrays of indices to this MeshPart
+
+        :param vertex: array of the vertex indices
+        :param tex_coord: array of the texture coordinate indices, or None
+        :param normal: array of the normal indices, or None
+        """
+        new_arrays = {'vertex': vertex, 'tex_coord': tex_coord, 'normal': normal}
+
+        if self._faces is not None and len(self._faces) == 0:
+            self._index_arrays = new_arrays
+            self._partial = set()
+            self._faces = None
+            return
+
+        from numpy import concatenate, full
+        from .arrays import INDEX_DTYPE
+
+        self.get_index_array()
+        counts = (len(self._index_arrays['vertex']), len(vertex))
+
+        for (name, array) in new_arrays.items():
+            if self._index_arrays[name] is None and array is None:
+                continue
+
+            # The faces without this attribute get -1 indices
+            if self._index_arrays[name] is None or array is None:
+                arrays = [self._index_arrays[name], array]
+                arrays = [a if a is not None else full((count, 3), -1, dtype=INDEX_DTYPE) for (a, count) in zip(arrays, counts)]
+                self._partial.add(name)
+            else:
+                arrays = [self._index_arrays[name], array]
+
+            self._index_arrays[name] = concatenate(arrays)
+
+    def face_count(self):
+        """Returns the number of faces without building any list
+        """
+        if self._faces is not None:
+            return len(self._faces)
+        return len(self._index_arrays['vertex'])
 
     def init_texture(self):
         """Initializes the material of the current parent
@@ -0,0 +1,81 @@
+import contextlib
+import time
+
+@contextlib.contextmanager
+def stage(hook, name):
+    """Context that times a stage of a conversion and reports it to a hook
+
+    The context gives a dict where the stage can put its counts, e.g. the
+    number of faces or of bytes, which are given to the hook with the time
+    the stage took. Nothing is measured if the hook is None.
+
+    :param hook: callable taking the name of the stage, its time in seconds and
+    its counts as keyword arguments, or None
+    :param name: name of the stage, e.g. parse or write
+    """
+    counts = {}
+
+    if hook is None:
+        yield counts
+        return
+
+    start = time.perf_counter()
+    yield counts
+    hook(name, time.perf_counter() - start, **counts)
+
+class Timings:
+    """Hook that records the stages of conversions, in order
+
+    Each record is a (name, seconds, counts) tuple.
+    """
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, name, seconds, **counts):
+        self.records.append((name, seconds, counts))
+
+    def total(self):
+        """Returns the time of all the recorded stages
+        """
+        return sum(seconds for (name, seconds, counts) in self.records)
+
+    def report(self):
+        """Returns a table of the stages, their time, their share of the total
+        time and their counts
+        """
+        total = self.total()
+        lines = ['{:<12} {:>10} {:>6}  {}'.format('stage', 'seconds', '%', 'counts')]
+
+        for (name, seconds, counts) in self.records:
+            share = 100 * seconds / total if total > 0 else 0
+            details = ' '.join('{}={}'.format(key, value) for (key, value) in counts.items())
+            lines.append('{:<12} {:>10.4f} {:>6.1f}  {}'.format(name, seconds, share, details))
+
+        lines.append('{:<12} {:>10.4f} {:>6.1f}'.format('total', total, 100))
+        return '\n'.join(lines)
+
+class CountingFile:
+    """File object that counts the bytes written in another file object
+
+    It is seekable if the other file object is, so that the bytes written
+    again after a seek are not counted twice.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.size = 0
+        self.position = 0
+
+    def write(self, bytes):
+        self.file.write(bytes)
+        self.position += len(bytes)
+        self.size = max(self.size, self.position)
+
+    def seekable(self):
+        return getattr(self.file, 'seekable', lambda: False)()
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, offset):
+        self.position += offset - self.file.tell()
+        return self.file.seek(offset)
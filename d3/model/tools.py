@@ -1,33 +1,68 @@
+import contextlib
+import itertools
 import os
+import time
 from importlib import import_module
 
-from . import formats
-from .formats import *
-from .basemodel import ModelParser, Exporter
+from .basemodel import ModelParser, Exporter, StreamableExporter
+from .arrays import scaling_matrix, translation_matrix
+from .profiling import stage, CountingFile
 
-from types import ModuleType
+SNIFF_SIZE = 512
+"""Number of bytes at the beginning of a file given to the sniff functions
+"""
 
-supported_formats = []
+def file_extension(filename):
+    """Returns the extension of a file, with the dot, or an empty string
+
+    Unlike os.path.splitext, a name that is only an extension, e.g. .ply,
+    has an extension.
+
+    :param filename: path to the file
+    """
+    (name, dot, extension) = os.path.basename(filename).rpartition('.')
+    return dot + extension if dot else ''
 
 class ModelType:
     """Represents a type of coding of 3D object, and the module enabling
     parsing and exporting
+
+    The module is only imported when a parser or an exporter is created, so
+    that the formats that are not used cost nothing. It must have a parser and
+    an exporter class named after the format, e.g. OBJParser and OBJExporter.
     """
-    def __init__(self, typename, inner_module):
+    def __init__(self, typename, module, extensions, sniff = None):
         """Creates a ModelType
 
         :param typename: the name of the 3D format
-        :param inner_module: the module that will parse and export the format
+        :param module: the module that will parse and export the format, or
+        its absolute name
+        :param extensions: extensions of the files of the format, with the dot
+        :param sniff: function that checks whether the beginning of a file
+        looks like the format, see sniff_type, or None
         """
         self.typename = typename
-        self.inner_module = inner_module
+        self.module_name = module if isinstance(module, str) else module.__name__
+        self.extensions = extensions
+        self.sniff = sniff
+        self._inner_module = None if isinstance(module, str) else module
+
+    @property
+    def inner_module(self):
+        """The module that parses and exports the format, imported on first use
+        """
+        if self._inner_module is None:
+            self._inner_module = import_module(self.module_name)
+        return self._inner_module
 
     def test_type(self, file):
         """Tests if a file has the correct type
 
+        Only checks the extension of the file, without importing the module.
+
         :param file: path to the file to test
         """
-        return getattr(self.inner_module, 'is_' + self.typename)(file)
+        return file_extension(file) in self.extensions
 
     def create_parser(self, *args, **kwargs):
         """Creates a parser of the current type
@@ -39,61 +74,380 @@ class ModelType:
         """
         return getattr(self.inner_module, self.typename.upper() + 'Exporter')(*args, **kwargs)
 
-def find_type(filename, supported_formats):
+supported_formats = []
+"""Formats that we have modules for, in the order they were registered
+"""
+
+formats_by_extension = {}
+"""Formats of supported_formats by extension
+"""
+
+def register_format(typename, module, extensions, sniff = None):
+    """Adds a format to the supported formats, or replaces the one of the
+    same name
+
+    Returns the ModelType of the format. The module is only imported when a
+    file of the format is read or written.
+
+    :param typename: the name of the 3D format, e.g. xyz for a module with the
+    XYZParser and XYZExporter classes
+    :param module: the module that will parse and export the format, or its
+    absolute name
+    :param extensions: extensions of the files of the format, with the dot,
+    e.g. ['.xyz']
+    :param sniff: function taking the first SNIFF_SIZE bytes of a file and its
+    size, which checks whether the file looks like the format, used for the
+    files whose extension is unknown, or None
+    """
+    type = ModelType(typename, module, list(extensions), sniff)
+
+    for (index, registered) in enumerate(supported_formats):
+        if registered.typename == typename:
+            # The extensions taken since by other formats stay theirs
+            for extension in registered.extensions:
+                if formats_by_extension.get(extension) is registered:
+                    del formats_by_extension[extension]
+            supported_formats[index] = type
+            break
+    else:
+        supported_formats.append(type)
+
+    for extension in type.extensions:
+        formats_by_extension[extension] = type
+
+    return type
+
+def _sniff_off(header, size):
+    """Checks that a file begins like a .off file, e.g. with OFF or COFF
+    """
+    return header.lstrip().split(maxsplit=1)[:1] in [[b'OFF'], [b'COFF'], [b'NOFF'], [b'CNOFF']]
+
+def _sniff_ply(header, size):
+    """Checks that a file begins like an ascii or binary .ply file
+    """
+    return header.startswith(b'ply\n') or header.startswith(b'ply\r\n')
+
+def _sniff_stl(header, size):
+    """Checks that a file begins like an ascii .stl file, or has the size of a
+    binary .stl file given by its number of triangles
+    """
+    if header.lstrip().startswith(b'solid'):
+        return True
+    return len(header) >= 84 and size == 84 + 50 * int.from_bytes(header[80:84], 'little')
+
+register_format('obj', 'd3.model.formats.obj', ['.obj'])
+register_format('off', 'd3.model.formats.off', ['.off'], _sniff_off)
+register_format('ply', 'd3.model.formats.ply', ['.ply'], _sniff_ply)
+register_format('stl', 'd3.model.formats.stl', ['.stl'], _sniff_stl)
+
+def sniff_type(filename, formats = None):
+    """Find the type of a file from its first bytes
+
+    Returns the first format whose sniff function accepts the file, or None.
+
+    :param filename: path to an existing file
+    :param formats: list of formats to try, the registered ones if None
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(SNIFF_SIZE)
+    size = os.path.getsize(filename)
+
+    for type in formats if formats is not None else supported_formats:
+        if type.sniff is not None and type.sniff(header, size):
+            return type
+
+def find_type(filename, supported_formats = None, sniff = False):
     """Find the correct type from a filename
 
     :param filename: path to the file
-    :param supported_formats: list of formats that we have modules for
+    :param supported_formats: list of formats that we have modules for, the
+    registered ones, found by their extension, if None
+    :param sniff: if the extension is unknown and the file exists, find the
+    type from its first bytes
     """
-    for type in supported_formats:
-        if type.test_type(filename):
-            return type
+    if supported_formats is None:
+        type = formats_by_extension.get(file_extension(filename))
+    else:
+        type = next((type for type in supported_formats if type.test_type(filename)), None)
 
-for name in formats.__dict__:
-    if isinstance(formats.__dict__[name], ModuleType) and name != 'glob':
-        type = ModelType(name, formats.__dict__[name])
-        supported_formats.append(type)
+    if type is None and sniff and os.path.isfile(filename):
+        type = sniff_type(filename, supported_formats)
 
-def load_model(path, up_conversion = None):
-    """Loads a model from a path
+    return type
 
-    :param path: path to the file to load
-    :param up_conversion: conversion of up vectors
+def create_parser(path, up_conversion = None, memory_map = False, processes = None, transform = None, hook = None):
+    """Creates the parser of a file, without parsing it
+
+    The hook is given the time of the detect stage. See load_model for the
+    parameters.
     """
     parser = None
-    type = find_type(path, supported_formats)
+
+    with stage(hook, 'detect') as counts:
+        type = find_type(path, sniff=True)
+        counts['format'] = type.typename if type is not None else None
 
     if type is None:
         raise Exception("File format not supported \"" + str(type) + "\"")
 
     parser = type.create_parser(up_conversion)
-    parser.parse_file(path)
+    parser.memory_map = memory_map
+    parser.processes = processes
+
+    if transform is not None:
+        parser.add_transform(transform)
+
+    return parser
+
+def load_model(path, up_conversion = None, memory_map = False, processes = None, transform = None, hook = None):
+    """Loads a model from a path
+
+    The up conversion and the transform are applied to the whole arrays of
+    vertices and normals once the file is parsed. The hook is given the time
+    of the detect, parse and transform stages. The format is found from the
+    extension of the file, or from its first bytes if the extension is
+    unknown.
+
+    :param path: path to the file to load
+    :param up_conversion: conversion of up vectors
+    :param memory_map: map binary files in memory instead of reading them
+    :param processes: number of processes used by the parsers that can parse
+    chunks of the file in parallel, e.g. the one of .obj files
+    :param transform: 4x4 matrix applied after the up conversion, or None
+    :param hook: callable given the name, the time and the counts of each
+    stage, see profiling.stage, or None
+    """
+    parser = create_parser(path, up_conversion, memory_map, processes, transform, hook)
+
+    with stage(hook, 'parse') as counts:
+        parser.parse_file(path)
+        counts['bytes'] = os.path.getsize(path)
+        counts['vertices'] = parser.get_count('vertices')
+        counts['faces'] = parser.face_count()
+
+    with stage(hook, 'transform'):
+        parser.apply_transforms()
 
     return parser
 
-def export_model(model, path):
+def export_model(model, path, hook = None, **options):
     """Exports a model to a path
 
+    The exporter is only created: the model is generated when it is written.
+    The hook is given the time of the detect and prepare stages.
+
     :param model: model to export
     :param path: path to save the model
+    :param hook: callable given the name, the time and the counts of each
+    stage, see profiling.stage, or None
+    :param options: keyword arguments given to the exporter of the format
     """
     exporter = None
-    type = find_type(path, supported_formats)
+
+    with stage(hook, 'detect') as counts:
+        type = find_type(path)
+        counts['format'] = type.typename if type is not None else None
 
     if type is None:
         raise Exception('File format is not supported')
 
-    exporter = type.create_exporter(model)
+    with stage(hook, 'prepare'):
+        exporter = type.create_exporter(model, **options)
+
     return exporter
 
-def convert(input, output, up_conversion = None):
+def stream_model(input, output, file, up_conversion = None, transform = None, hook = None, **options):
+    """Converts a model piece by piece, without loading the whole model
+
+    The input is read by the stream_file method of its parser, and each piece
+    is written by the write_stream method of the exporter before the next one
+    is read, so the memory used does not depend on the size of the model.
+    The hook is given the time of the detect and prepare stages, and of the
+    stream stage which reads and writes the pieces.
+
+    :param input: path of the input model
+    :param output: path of the output, only its extension is used
+    :param file: file object opened in binary mode where the model is written
+    :param up_conversion: convert the up vector
+    :param transform: 4x4 matrix applied to the model after the up conversion
+    :param hook: callable given the name, the time and the counts of each
+    stage, see profiling.stage, or None
+    :param options: keyword arguments given to the exporter
+    """
+    parser = create_parser(input, up_conversion, transform=transform, hook=hook)
+    pieces = parser.stream_file(input)
+
+    # The exporter is created from the first piece, stream_file always yields
+    # one, and exporters with a header may take their properties from a later
+    # piece, see PLYExporter.write_stream
+    with stage(hook, 'parse'):
+        first = next(pieces)
+
+    exporter = export_model(first, output, hook, **options)
+
+    if not isinstance(exporter, StreamableExporter):
+        raise Exception('The ' + exporter.__class__.__name__ + ' cannot write a stream')
+
+    with stage(hook, 'stream') as counts:
+        counter = CountingFile(file)
+        exporter.write_stream(itertools.chain([first], pieces), counter)
+        counts['bytes'] = counter.size
+
+@contextlib.contextmanager
+def replacing_file(path):
+    """Context that gives a temporary file which replaces a path once complete
+
+    The temporary file is opened in binary mode next to the path. It replaces
+    the path when the context exits, and is removed if an exception is raised
+    instead, so that a failed conversion leaves the previous file unchanged
+    and never leaves an output that looks up to date.
+
+    :param path: path of the file to write
+    """
+    temporary = path + '.tmp'
+
+    try:
+        with open(temporary, 'wb') as f:
+            yield f
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+def convert(input, output, up_conversion = None, file = None, memory_map = False, processes = None, cache = None,
+            transform = None, hook = None, stream = False, weld = None, **options):
     """Converts a model
 
+    The converted model is written chunk by chunk, without building the whole
+    file in memory. The hook is given the time of the stages of load_model and
+    export_model, then of the weld and write stages, and of the cache stage if
+    there is a cache. With stream, the model is converted by stream_model
+    instead.
+
     :param input: path of the input model
     :param output: path to the output
     :param up_conversion: convert the up vector
+    :param file: file object opened in binary mode where the model is written,
+    the output path is written with replacing_file if it is None
+    :param memory_map: map binary input files in memory instead of reading them
+    :param processes: number of processes used to parse the input
+    :param cache: a ConversionCache where the converted model is looked for
+    before converting it, and stored after, or None
+    :param transform: 4x4 matrix applied to the model after the up conversion
+    :param hook: callable given the name, the time and the counts of each
+    stage, see profiling.stage, or None
+    :param stream: convert the model piece by piece with stream_model, for
+    the inputs too big to be loaded
+    :param weld: merge the vertices closer than this epsilon before writing
+    the model, see ModelParser.weld_vertices, or None
+    :param options: keyword arguments given to the exporter
     """
-    model = load_model(input, up_conversion)
-    exporter = export_model(model, output)
-    return str(exporter)
+    if stream and weld is not None:
+        raise Exception('weld cannot be used with stream, which never has the whole model')
+
+    if file is None:
+        with replacing_file(output) as f:
+            return convert(input, output, up_conversion, f, memory_map, processes, cache, transform, hook, stream,
+                           weld, **options)
+
+    if cache is not None:
+        with stage(hook, 'cache') as counts:
+            # Welding changes the model, but it is not an option of the
+            # exporter, and streamed files have the same model, but not the
+            # same bytes
+            key_options = dict(options, weld=weld)
+            if stream:
+                key_options['stream'] = True
+            key = cache.key(input, output, up_conversion, key_options, transform)
+            counts['hit'] = cache.copy(key, file)
+        if counts['hit']:
+            return
+
+    if stream:
+        if cache is None:
+            stream_model(input, output, file, up_conversion, transform, hook, **options)
+        else:
+            with cache.storing(key, file) as f:
+                stream_model(input, output, f, up_conversion, transform, hook, **options)
+        return
+
+    model = load_model(input, up_conversion, memory_map, processes, transform, hook)
+
+    if weld is not None:
+        with stage(hook, 'weld') as counts:
+            model.weld_vertices(weld)
+            counts['vertices'] = model.get_count('vertices')
+
+    exporter = export_model(model, output, hook, **options)
+
+    with stage(hook, 'write') as counts:
+        counter = CountingFile(file)
+        if cache is None:
+            exporter.write(counter)
+        else:
+            with cache.storing(key, counter) as f:
+                exporter.write(f)
+        counts['bytes'] = counter.size
+
+def is_up_to_date(input, output):
+    """Checks whether an output exists and is newer than its input
+
+    :param input: path of the input model
+    :param output: path of the converted model
+    """
+    return os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(input)
+
+def _convert_timed(input, output, up_conversion, memory_map, cache, transform, stream, weld, options):
+    """Converts a model for convert_many
+
+    Returns the time the conversion took and the error message if it failed,
+    None otherwise.
+    """
+    start = time.perf_counter()
+
+    try:
+        convert(input, output, up_conversion, None, memory_map, cache=cache, transform=transform, stream=stream,
+                weld=weld, **options)
+    except (Exception, SystemExit) as e:
+        return (time.perf_counter() - start, '{}: {}'.format(e.__class__.__name__, e))
+
+    return (time.perf_counter() - start, None)
+
+def convert_many(jobs, up_conversion = None, memory_map = False, processes = None, force = False, cache = None,
+                 transform = None, stream = False, weld = None, **options):
+    """Converts several models with a pool of processes
+
+    Generates a (input, output, seconds, error) tuple for each conversion, as
+    soon as it is finished: seconds is the time the conversion took, or None
+    if it was skipped because the output is up to date, and error is the
+    message of the exception that made it fail, or None.
+
+    :param jobs: list of (input, output) paths
+    :param up_conversion: convert the up vector
+    :param memory_map: map binary input files in memory instead of reading them
+    :param processes: number of processes of the pool, the number of CPUs if
+    None
+    :param force: convert the inputs even if their output is up to date
+    :param cache: a ConversionCache used by the conversions, or None
+    :param transform: 4x4 matrix applied to the models after the up conversion
+    :param stream: convert the models piece by piece, see stream_model
+    :param weld: merge the vertices of the models closer than this epsilon,
+    see convert, or None
+    :param options: keyword arguments given to the exporters
+    """
+    # The pool is only needed in batch mode
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(processes) as executor:
+        futures = {}
+
+        for (input, output) in jobs:
+            if not force and is_up_to_date(input, output):
+                yield (input, output, None, None)
+            else:
+                futures[executor.submit(_convert_timed, input, output, up_conversion, memory_map, cache, transform,
+                                         stream, weld, options)] = (input, output)
 
+        for future in as_completed(futures):
+            yield futures[future] + future.result()
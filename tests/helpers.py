@@ -0,0 +1,69 @@
+"""Test cases and functions shared by the tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from d3.model.basemodel import TextModelParser
+
+def parse_lines(parser, path):
+    """Parses a file with the line by line parser of TextModelParser
+    """
+    TextModelParser.parse_file(parser, path)
+    return parser
+
+def parts(model):
+    """Returns the material and the indices of the faces of each part of a model
+    """
+    return [(part.material.name if part.material is not None else None,
+             [part.get_index_array(attribute) for attribute in ('vertex', 'tex_coord', 'normal')])
+            for part in model.parts if part.face_count() > 0]
+
+class ModelTestCase(unittest.TestCase):
+    """Test case with a temporary directory where the models are written
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        """Returns the path of a file of the temporary directory
+        """
+        return os.path.join(self.directory, name)
+
+    def write(self, name, content):
+        """Writes a file of the temporary directory and returns its path
+        """
+        path = self.path(name)
+        with open(path, 'wb') as f:
+            f.write(content.encode() if isinstance(content, str) else content)
+        return path
+
+    def read(self, name):
+        """Returns the content of a file of the temporary directory
+        """
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+    def assertSameModel(self, model, expected):
+        for name in ('vertices', 'tex_coords', 'normals', 'colors'):
+            self.assertEqual(model.get_count(name), expected.get_count(name), name)
+            if expected.get_count(name) > 0:
+                np.testing.assert_array_equal(model.get_array(name), expected.get_array(name), name)
+
+        model_parts = parts(model)
+        expected_parts = parts(expected)
+        self.assertEqual([material for (material, indices) in model_parts],
+                         [material for (material, indices) in expected_parts])
+
+        for ((material, indices), (_, expected_indices)) in zip(model_parts, expected_parts):
+            for (array, expected_array) in zip(indices, expected_indices):
+                if expected_array is None:
+                    self.assertIsNone(array)
+                else:
+                    np.testing.assert_array_equal(array, expected_array)
@@ -0,0 +1,175 @@
+"""Checks of the array operations on the vertices and the faces of models
+"""
+import unittest
+
+import numpy as np
+
+import d3.model.tools as mt
+from d3.model.arrays import weld, face_normals, vertex_normals, scaling_matrix, translation_matrix
+from d3.model.formats.obj import OBJParser
+
+from helpers import ModelTestCase
+
+# Two triangles whose shared vertices are repeated, with the colors of the
+# first occurrence
+OBJ_REPEATED = """v 0 0 0 1 0 0
+v 1 0 0 0 1 0
+v 0 1 0 0 0 1
+v 1 0 0 0 1 0
+v 1 1 0 1 1 1
+v 0 1 0 0 0 1
+f 1 2 3
+f 4 5 6
+"""
+
+class WeldTest(ModelTestCase):
+    def test_cell_boundary(self):
+        (kept, remap) = weld(np.array([[1e-9, 0, 0], [-1e-9, 0, 0]], dtype='float32'), 1e-6)
+        self.assertEqual(kept.tolist(), [0])
+        self.assertEqual(remap.tolist(), [0, 0])
+
+    def test_equal(self):
+        (kept, remap) = weld(np.array([[0, 0, 0], [-0.0, 0, 0], [1, 0, 0], [0, 0, 0]], dtype='float32'))
+        self.assertEqual(kept.tolist(), [0, 2])
+        self.assertEqual(remap.tolist(), [0, 0, 1, 0])
+
+    def test_chain(self):
+        # The last vertex is not close to the first one, which takes the second
+        (kept, remap) = weld(np.array([[0, 0, 0], [0.6, 0, 0], [1.2, 0, 0]], dtype='float32'), 1)
+        self.assertEqual(kept.tolist(), [0, 2])
+        self.assertEqual(remap.tolist(), [0, 0, 1])
+
+    def test_random(self):
+        random = np.random.default_rng(0)
+        vertices = random.random((200, 3)).astype('float32')
+        epsilon = 0.1
+
+        (kept, remap) = weld(vertices, epsilon)
+
+        # Greedy merge in the order of the vertices
+        target = list(range(len(vertices)))
+        for i in range(len(vertices)):
+            if target[i] == i:
+                for j in range(i + 1, len(vertices)):
+                    if target[j] == j and np.all(np.abs(vertices[i] - vertices[j].astype('float64')) <= epsilon):
+                        target[j] = i
+
+        self.assertEqual(kept.tolist(), sorted(set(target)))
+        self.assertEqual(kept[remap].tolist(), target)
+
+    def test_weld_vertices(self):
+        model = OBJParser()
+        model.parse_file(self.write('repeated.obj', OBJ_REPEATED))
+        model.weld_vertices()
+
+        np.testing.assert_array_equal(model.get_array('vertices'), [[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]])
+        np.testing.assert_array_equal(model.get_array('colors'), [[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 1]])
+        np.testing.assert_array_equal(model.get_index_array(), [[0, 1, 2], [1, 3, 2]])
+
+# A pyramid whose faces have different areas and angles
+PYRAMID_VERTICES = np.array([[0, 0, 0], [2, 0, 0], [0, 1, 0], [0, 0, 3], [1, 1, 1]], dtype='float32')
+PYRAMID_FACES = np.array([[0, 2, 1], [0, 1, 3], [0, 3, 2], [1, 2, 4], [1, 4, 3], [2, 3, 4]], dtype='int32')
+
+def _vertex_normals(vertices, faces, weighting):
+    """Returns the normals of the vertices summed face by face
+    """
+    normals = np.zeros((len(vertices), 3))
+
+    for face in faces:
+        corners = vertices[face].astype('float64')
+        cross = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+
+        for i in range(3):
+            if weighting == 'area':
+                normals[face[i]] += cross
+            else:
+                edges = [corners[(i + 1) % 3] - corners[i], corners[(i + 2) % 3] - corners[i]]
+                cosine = np.dot(*edges) / (np.linalg.norm(edges[0]) * np.linalg.norm(edges[1]))
+                normals[face[i]] += cross / np.linalg.norm(cross) * np.arccos(cosine)
+
+    return normals / np.linalg.norm(normals, axis=1)[:, np.newaxis]
+
+class NormalsTest(ModelTestCase):
+    def test_face_normals(self):
+        vertices = np.array([[0, 0, 0], [2, 0, 0], [0, 3, 0], [4, 0, 0]], dtype='float32')
+        normals = face_normals(vertices, np.array([[0, 1, 2], [0, 2, 1], [0, 1, 3]]))
+
+        # The normal of a degenerate face is zero
+        np.testing.assert_allclose(normals, [[0, 0, 1], [0, 0, -1], [0, 0, 0]])
+
+    def test_vertex_normals(self):
+        for weighting in ('area', 'angle'):
+            with self.subTest(weighting=weighting):
+                np.testing.assert_allclose(vertex_normals(PYRAMID_VERTICES, PYRAMID_FACES, weighting),
+                                           _vertex_normals(PYRAMID_VERTICES, PYRAMID_FACES, weighting), atol=1e-6)
+
+        with self.assertRaises(ValueError):
+            vertex_normals(PYRAMID_VERTICES, PYRAMID_FACES, 'volume')
+
+    def test_generate_normals(self):
+        lines = ['v {} {} {}'.format(*vertex) for vertex in PYRAMID_VERTICES.tolist()]
+        lines += ['f {} {} {}'.format(*face) for face in (PYRAMID_FACES + 1).tolist()]
+
+        model = OBJParser()
+        model.parse_file(self.write('pyramid.obj', '\n'.join(lines) + '\n'))
+
+        model.generate_vertex_normals()
+        np.testing.assert_allclose(model.get_array('normals'),
+                                   _vertex_normals(PYRAMID_VERTICES, PYRAMID_FACES, 'area'), atol=1e-6)
+        np.testing.assert_array_equal(model.get_index_array('normal'), PYRAMID_FACES)
+
+        model.generate_face_normals()
+        np.testing.assert_allclose(model.get_array('normals'), face_normals(PYRAMID_VERTICES, PYRAMID_FACES))
+        np.testing.assert_array_equal(model.get_index_array('normal'), np.repeat(np.arange(6), 3).reshape(-1, 3))
+
+OBJ_NORMALS = """v 1 2 3
+v 4 5 6
+v 7 8 10
+vn 0 0 1
+vn 0.6 0.8 0
+f 1//1 2//2 3//1
+"""
+
+class TransformTest(ModelTestCase):
+    def load(self, up_conversion = None, transform = None):
+        return mt.load_model(self.write('model.obj', OBJ_NORMALS), up_conversion, transform=transform)
+
+    def test_up_conversion(self):
+        # The coordinates are permuted like the vertices of the line by line
+        # parser were, and the normals follow them
+        model = self.load(('y', 'z'))
+        np.testing.assert_array_equal(model.get_array('vertices'), [[2, 3, 1], [5, 6, 4], [8, 10, 7]])
+        np.testing.assert_allclose(model.get_array('normals'), [[0, 1, 0], [0.8, 0, 0.6]])
+
+        model = self.load(('z', 'y'))
+        np.testing.assert_array_equal(model.get_array('vertices'), [[3, 1, 2], [6, 4, 5], [10, 7, 8]])
+        np.testing.assert_allclose(model.get_array('normals'), [[1, 0, 0], [0, 0.6, 0.8]])
+
+    def test_transform(self):
+        # Scaled, then translated, after the up conversion
+        transform = translation_matrix(1, 0, -1).dot(scaling_matrix(2, 1, 1))
+        model = self.load(('y', 'z'), transform)
+
+        np.testing.assert_array_equal(model.get_array('vertices'), [[5, 3, 0], [11, 6, 3], [17, 10, 6]])
+
+        # The normals are transformed by the inverse transpose, and normalized
+        np.testing.assert_allclose(model.get_array('normals'), [[0, 1, 0], [0.4, 0, 0.6] / np.hypot(0.4, 0.6)],
+                                   rtol=1e-6)
+
+    def test_pending_transforms(self):
+        # The transforms are composed and applied once, by the exporter too
+        model = OBJParser()
+        model.parse_file(self.write('model.obj', OBJ_NORMALS))
+        model.add_transform(scaling_matrix(2))
+        model.add_transform(translation_matrix(1, 1, 1))
+
+        np.testing.assert_array_equal(model.get_array('vertices')[0], [1, 2, 3])
+
+        mt.export_model(model, 'model.off')
+        np.testing.assert_array_equal(model.get_array('vertices')[0], [3, 5, 7])
+
+        model.apply_transforms()
+        np.testing.assert_array_equal(model.get_array('vertices')[0], [3, 5, 7])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Checks of the cache of the converted models
+"""
+import io
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+
+import d3.model.tools as mt
+from d3.model.cache import ConversionCache
+from d3.model.profiling import Timings
+
+from helpers import ModelTestCase
+
+CONVERT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'convert.py')
+"""Path of the command line converter
+"""
+
+TRIANGLE = "v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n"
+
+COLORED_TRIANGLE = "v 0 0 0 1 0 0\nv 1 0 0 0 1 0\nv 0 1 0 0 0 1\nf 1 2 3\n"
+
+def _stages(timings):
+    """Returns the names of the stages recorded by a Timings hook
+    """
+    return [name for (name, seconds, counts) in timings.records]
+
+class CacheTest(ModelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = ConversionCache(self.path('cache'))
+
+    def convert(self, input, output, **options):
+        """Converts a model with the cache and returns the names of its stages
+        """
+        timings = Timings()
+        mt.convert(input, self.path(output), cache=self.cache, hook=timings, **options)
+        return _stages(timings)
+
+    def test_hit(self):
+        input = self.write('model.obj', TRIANGLE)
+
+        self.assertIn('parse', self.convert(input, 'first.ply'))
+        self.assertEqual(self.convert(input, 'second.ply'), ['cache'])
+        self.assertEqual(self.read('first.ply'), self.read('second.ply'))
+
+        # The key depends on the content of the input, not on its path
+        shutil.copy(input, self.path('copy.obj'))
+        self.assertEqual(self.convert(self.path('copy.obj'), 'third.ply'), ['cache'])
+
+    def test_miss(self):
+        input = self.write('model.obj', TRIANGLE)
+        self.convert(input, 'model.ply')
+
+        for options in [dict(format='binary_little_endian'), dict(weld=0.0), dict(up_conversion=('y', 'z'))]:
+            with self.subTest(**options):
+                self.assertIn('parse', self.convert(input, 'other.ply', **options))
+
+        self.assertIn('parse', self.convert(input, 'model.off'))
+
+        # A changed input is converted again
+        self.write('model.obj', COLORED_TRIANGLE)
+        self.assertIn('parse', self.convert(input, 'model.ply'))
+
+    def test_failure(self):
+        # An incomplete output is not cached
+        key = self.cache.key(self.write('model.obj', TRIANGLE), 'model.ply')
+
+        with self.assertRaises(ValueError):
+            with self.cache.storing(key, io.BytesIO()) as f:
+                f.write(b'ply\n')
+                raise ValueError()
+
+        self.assertFalse(self.cache.contains(key))
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_eviction(self):
+        self.cache.max_size = 10
+        keys = [self.cache.key(self.write('model.obj', TRIANGLE), 'model.' + format) for format in ('ply', 'off')]
+
+        with self.cache.storing(keys[0], io.BytesIO()) as f:
+            f.write(b'12345678')
+        os.utime(self.cache.path(keys[0]), (0, 0))
+
+        with self.cache.storing(keys[1], io.BytesIO()) as f:
+            f.write(b'abcdef')
+
+        # The least recently used entry is removed
+        self.assertFalse(self.cache.contains(keys[0]))
+        self.assertTrue(self.cache.contains(keys[1]))
+
+class CommandTest(ModelTestCase):
+    def run_convert(self, input, output):
+        """Converts a model with convert.py and a cache, and returns the names of its stages
+        """
+        process = subprocess.run([sys.executable, CONVERT, '-i', input, '-o', output, '--cache-dir', 'cache',
+                                  '--profile'], cwd=self.directory, stderr=subprocess.PIPE, check=True)
+        lines = process.stderr.decode().splitlines()
+        return [line.split()[0] for line in lines[1:-1]]
+
+    def test_colorless_ply(self):
+        # Only the ply without colors is written, and the next conversion is
+        # a hit too
+        self.write('model.obj', TRIANGLE)
+
+        self.assertIn('parse', self.run_convert('model.obj', 'model.ply'))
+        self.assertEqual(self.run_convert('model.obj', 'again.ply'), ['cache'])
+        self.assertEqual(self.read('model.ply'), self.read('again.ply'))
+        self.assertFalse(os.path.exists(self.path('againWithRGB.ply')))
+
+    def test_colored_ply(self):
+        self.write('model.obj', COLORED_TRIANGLE)
+
+        self.assertIn('parse', self.run_convert('model.obj', 'model.ply'))
+        self.assertEqual(self.run_convert('model.obj', 'again.ply'), ['cache', 'cache'])
+        self.assertEqual(self.read('modelWithRGB.ply'), self.read('againWithRGB.ply'))
+
+if __name__ == '__main__':
+    unittest.main()
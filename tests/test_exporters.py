@@ -0,0 +1,152 @@
+"""Checks of the exporters, which write the models chunk by chunk
+"""
+import io
+import os
+import unittest
+
+import d3.model.tools as mt
+from d3.model.formats.obj import OBJParser
+from d3.model.formats.ply import PLYParser, PLYExporter
+
+from helpers import ModelTestCase
+
+MTL = """newmtl red
+Kd 1 0 0
+newmtl blue
+Kd 0 0 1
+"""
+
+OBJ_MODEL = """mtllib model.mtl
+v 0 0 0 1 0 0
+v 1 0 0 0 1 0
+v 1 1 0 0 0 1
+v 0 1 0 1 1 1
+v 0.5 0.5 1 0.5 0.5 0.5
+vt 0 0
+vt 1 0
+vt 1 1
+vn 0 0 1
+vn 0 0 -1
+usemtl red
+f 1/1/1 2/2/1 3/3/1
+f 1/1/2 3/3/2 4/2/2
+usemtl blue
+f 2/1/1 3/2/1 5/3/1
+"""
+
+FORMATS = ['obj', 'off', 'ply', 'stl']
+
+class ExporterTestCase(ModelTestCase):
+    def load(self):
+        self.write('model.mtl', MTL)
+        model = OBJParser()
+        model.parse_file(self.write('model.obj', OBJ_MODEL))
+        return model
+
+class WriteTest(ExporterTestCase):
+    def test_batches(self):
+        # The chunks do not depend on the size of the batches
+        for format in FORMATS:
+            expected = bytes(mt.export_model(self.load(), 'model.' + format))
+
+            for batch_size in (1, 2, 3):
+                with self.subTest(format=format, batch_size=batch_size):
+                    exporter = mt.export_model(self.load(), 'model.' + format)
+                    exporter.batch_size = batch_size
+                    file = io.BytesIO()
+                    exporter.write(file)
+                    self.assertEqual(file.getvalue(), expected)
+
+    def test_str(self):
+        for format in FORMATS:
+            with self.subTest(format=format):
+                exporter = mt.export_model(self.load(), 'model.' + format)
+                self.assertEqual(str(exporter).encode(), bytes(exporter))
+
+    def test_convert(self):
+        self.load()
+
+        for format in FORMATS:
+            with self.subTest(format=format):
+                output = self.path('converted.' + format)
+                mt.convert(self.path('model.obj'), output)
+                self.assertEqual(self.read('converted.' + format), bytes(mt.export_model(self.load(), output)))
+
+    def test_partial_attributes(self):
+        # The faces keep their texture coordinates and normals even when the
+        # other faces of their part, or of their batch, do not have them
+        faces = ['f 1/1 2/1 3/1', 'f 2 3 4', 'f 1//1 2//1 3//1', 'usemtl red', 'f 1/1/1 2/1/1 4/1/1', 'f 2 3 4']
+        lines = ['mtllib model.mtl', 'v 0 0 0', 'v 1 0 0', 'v 0 1 0', 'v 1 1 0', 'vt 0 0', 'vn 0 0 1'] + faces
+        self.write('model.mtl', MTL)
+        input = self.write('partial.obj', '\n'.join(lines) + '\n')
+
+        for batch_size in (1, 2, 16384):
+            with self.subTest(batch_size=batch_size):
+                exporter = mt.export_model(mt.load_model(input), 'model.obj')
+                exporter.batch_size = batch_size
+                self.assertEqual([line for line in str(exporter).splitlines() if line[:2] in ('f ', 'us')], faces)
+
+        model = mt.load_model(input)
+        self.assertIsNone(model.get_index_array('tex_coord'))
+        self.assertEqual([face.a.tex_coord for face in model.parts[0].faces], [0, None, None])
+
+    def test_failed_convert(self):
+        # A conversion failing while it writes the faces, which refer to
+        # missing vertices, leaves the previous output unchanged
+        output = self.write('converted.stl', 'previous')
+        input = self.write('broken.off', 'OFF\n1 1 0\n0 0 0\n3 0 1 2\n')
+
+        with self.assertRaises(Exception):
+            mt.convert(input, output)
+
+        self.assertEqual(self.read('converted.stl'), b'previous')
+        self.assertFalse(os.path.exists(output + '.tmp'))
+
+class BinaryTest(ExporterTestCase):
+    def parse_ply(self, content):
+        model = PLYParser()
+        model.parse_file(self.write('exported.ply', content))
+        return model
+
+    def test_ply(self):
+        expected = self.parse_ply(bytes(PLYExporter(self.load())))
+
+        for format in ('binary_little_endian', 'binary_big_endian'):
+            with self.subTest(format=format):
+                content = bytes(PLYExporter(self.load(), format=format))
+                self.assertIn(b'format ' + format.encode() + b' 1.0\n', content)
+                self.assertSameModel(self.parse_ply(content), expected)
+
+    def test_ply_alpha(self):
+        model = self.load()
+        model.alphas = [0.0, 0.25, 0.5, 0.75, 1.0]
+        expected = self.parse_ply(bytes(PLYExporter(model)))
+        self.assertIsNotNone(expected.alphas)
+
+        for format in ('binary_little_endian', 'binary_big_endian'):
+            with self.subTest(format=format):
+                model = self.load()
+                model.alphas = [0.0, 0.25, 0.5, 0.75, 1.0]
+                parsed = self.parse_ply(bytes(PLYExporter(model, format=format)))
+                self.assertSameModel(parsed, expected)
+                self.assertEqual(list(parsed.alphas), list(expected.alphas))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            PLYExporter(self.load(), format='binary')
+
+    def test_str(self):
+        # Binary files are only exported as bytes
+        for (output, format) in [('model.ply', 'binary_little_endian'), ('model.stl', 'binary')]:
+            with self.subTest(output=output):
+                exporter = mt.export_model(self.load(), output, format=format)
+
+                with self.assertRaises(Exception):
+                    str(exporter)
+
+                file = io.BytesIO()
+                exporter.write(file)
+                self.assertEqual(bytes(exporter), file.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Checks of the bulk .obj reader against the line by line parser
+"""
+import unittest
+
+from d3.model.formats.obj import OBJParser
+
+from helpers import ModelTestCase, parse_lines, parts
+
+MTL = """newmtl red
+Kd 1 0 0
+newmtl blue
+Kd 0 0 1
+"""
+
+# Three vertices, texture coordinates and normals are defined before each
+# group of faces, so that relative indices give the same result whatever
+# element they refer to
+OBJ_RELATIVE = """v 0 0 0
+v 1 0 0
+v 0 1 0
+vt 0 0
+vt 1 0
+vt 0 1
+vn 0 0 1
+vn 0 0 1
+vn 0 0 1
+f -3/-3/-3 -2/-2/-2 -1/-1/-1
+v 1 1 0
+v 2 1 0
+v 1 2 0
+vt 1 1
+vt 1 0
+vt 0 1
+vn 0 0 1
+vn 0 1 0
+vn 1 0 0
+f 1/1/1 -3/-3/-3 -1/-1/-1
+f -3/-3/-3 -2/-2/-2 -1/-1/-1 1/1/1
+"""
+
+OBJ_NORMALS = """v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+v 0.5 0.5 1
+vn 0 0 1
+vn 0 0 -1
+f 1//1 2//1 3//1 4//1
+f 1//2 2//2 5//2
+"""
+
+OBJ_MATERIALS = """mtllib model.mtl
+v 0 0 0 1 0 0
+v 1 0 0 0 1 0
+v 1 1 0 0 0 1
+v 0 1 0 1 1 1
+v 0.5 0.5 1 0.5 0.5 0.5
+usemtl red
+f 1 2 3
+f 1 3 4 5
+usemtl blue
+f 2 3 5
+usemtl red
+f 4 5 1 2 3
+"""
+
+# Faces of several forms cannot be read in bulk
+OBJ_IRREGULAR = """mtllib model.mtl
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+vt 0 0
+vt 1 1
+usemtl blue
+f 1 2 3
+f 1/1 3/2 4/1
+"""
+
+class OBJTest(ModelTestCase):
+    def check(self, content):
+        self.write('model.mtl', MTL)
+        path = self.write('model.obj', content)
+
+        model = OBJParser()
+        model.parse_file(path)
+        self.assertSameModel(model, parse_lines(OBJParser(), path))
+        return model
+
+    def test_relative_indices(self):
+        model = self.check(OBJ_RELATIVE)
+        self.assertEqual(model.face_count(), 4)
+
+    def test_normals_without_tex_coords(self):
+        model = self.check(OBJ_NORMALS)
+        self.assertIsNone(model.parts[0].get_index_array('tex_coord'))
+
+    def test_fans_and_materials(self):
+        model = self.check(OBJ_MATERIALS)
+        self.assertEqual(model.face_count(), 1 + 2 + 1 + 3)
+        self.assertEqual([name for (name, indices) in parts(model)], ['red', 'blue', 'red'])
+
+    def test_fallback(self):
+        self.check(OBJ_IRREGULAR)
+
+if __name__ == '__main__':
+    unittest.main()
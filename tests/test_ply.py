@@ -0,0 +1,149 @@
+"""Checks of the .ply reader on faces of mixed sizes
+"""
+import struct
+import unittest
+
+import numpy as np
+
+from d3.model.formats.ply import PLYParser
+
+from helpers import ModelTestCase
+
+PLY_HEADER = """ply
+format {} 1.0
+element vertex {}
+property float x
+property float y
+property float z
+property uchar red
+property uchar green
+property uchar blue
+element face {}
+property list uchar int vertex_indices
+end_header
+"""
+
+PLY_VERTICES = [(0, 0, 0, 255, 0, 0), (1, 0, 0, 0, 255, 0), (1, 1, 0, 0, 0, 255),
+                (0, 1, 0, 255, 255, 255), (0.5, 0.5, 1, 0, 0, 0), (2, 2, 2, 10, 20, 30)]
+
+PLY_FACES = [[0, 1, 2], [0, 2, 3, 4], [1, 2, 5], [0, 1, 2, 3, 5]]
+
+def _triangles(faces):
+    """Returns the triangles of the fans of faces
+    """
+    return [[face[0], face[i], face[i + 1]] for face in faces for i in range(1, len(face) - 1)]
+
+def _faces(count):
+    """Returns faces of 3 to 5 vertices, in runs of equal and of changing sizes
+    """
+    sizes = [3] * 40 + [4] * 30 + [3, 4, 5] * 30 + [5] * 20
+    return [[(i + j) % len(PLY_VERTICES) for j in range(sizes[i % len(sizes)])] for i in range(count)]
+
+class PLYTestCase(ModelTestCase):
+    def write_ply(self, format, faces = PLY_FACES):
+        """Writes the vertices of PLY_VERTICES and faces in a .ply file of a format
+        """
+        header = PLY_HEADER.format(format, len(PLY_VERTICES), len(faces))
+
+        if format == 'ascii':
+            lines = [' '.join(map(str, vertex)) for vertex in PLY_VERTICES]
+            lines += [' '.join(map(str, [len(face)] + face)) for face in faces]
+            content = header + '\n'.join(lines) + '\n'
+        else:
+            order = '<' if format == 'binary_little_endian' else '>'
+            content = header.encode()
+            content += b''.join(struct.pack(order + 'fffBBB', *vertex) for vertex in PLY_VERTICES)
+            content += b''.join(struct.pack(order + 'B' + 'i' * len(face), len(face), *face) for face in faces)
+
+        return self.write(format + '.ply', content)
+
+    def check(self, path, faces = PLY_FACES, **options):
+        """Parses a .ply file written by write_ply and checks its model
+        """
+        memory_map = options.pop('memory_map', False)
+        model = PLYParser()
+        model.memory_map = memory_map
+        model.parse_file(path, **options)
+
+        np.testing.assert_array_equal(model.get_array('vertices'), np.array(PLY_VERTICES)[:, :3])
+        np.testing.assert_allclose(model.get_array('colors') * 255, np.array(PLY_VERTICES)[:, 3:])
+        np.testing.assert_array_equal(model.get_index_array(), _triangles(faces))
+        return model
+
+class BinaryTest(PLYTestCase):
+    format = 'binary_little_endian'
+
+    def test_mixed_polygons(self):
+        self.check(self.write_ply(self.format))
+
+    def test_runs(self):
+        faces = _faces(1000)
+        self.check(self.write_ply(self.format, faces), faces)
+
+    def test_chunks(self):
+        # Records split between the chunks
+        faces = _faces(300)
+        path = self.write_ply(self.format, faces)
+
+        for chunk_size in (1, 7, 64, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                self.check(path, faces, chunk_size=chunk_size)
+
+    def test_truncated(self):
+        # The complete records of a truncated file are kept
+        content = self.read(self.write_ply(self.format))
+        path = self.write('truncated.ply', content[:-3])
+
+        for chunk_size in (7, 1 << 20):
+            with self.subTest(chunk_size=chunk_size):
+                self.check(path, PLY_FACES[:-1], chunk_size=chunk_size)
+
+    def test_memory_map(self):
+        faces = _faces(300)
+        model = self.check(self.write_ply(self.format, faces), faces, memory_map=True)
+
+        # The little endian vertices are a view on the map of the file
+        mapped = self.format == 'binary_little_endian'
+        self.assertEqual(np.shares_memory(model.get_array('vertices'), np.frombuffer(model.map, 'u1')), mapped)
+
+    def test_memory_map_truncated(self):
+        content = self.read(self.write_ply(self.format))
+        self.check(self.write('truncated.ply', content[:-3]), PLY_FACES[:-1], memory_map=True)
+
+class BigEndianTest(BinaryTest):
+    format = 'binary_big_endian'
+
+class ASCIITest(PLYTestCase):
+    def test_mixed_polygons(self):
+        faces = _faces(1000)
+        self.check(self.write_ply('ascii', faces), faces)
+
+    def test_chunks(self):
+        # The header and the lines split between the chunks
+        faces = _faces(300)
+        path = self.write_ply('ascii', faces)
+
+        for chunk_size in (1, 7, 64, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                self.check(path, faces, chunk_size=chunk_size)
+
+    def test_memory_map(self):
+        self.check(self.write_ply('ascii'), memory_map=True)
+
+    def test_header(self):
+        # Comments in the header, blank lines and no new line at the end
+        content = self.read(self.write_ply('ascii'))
+        content = content.replace(b'format ascii 1.0\n', b'format ascii 1.0\ncomment made by hand\nobj_info test\n')
+        content = content.replace(b'end_header\n', b'end_header\n\n')
+        path = self.write('header.ply', content.rstrip(b'\n'))
+
+        for chunk_size in (1, 1 << 20):
+            with self.subTest(chunk_size=chunk_size):
+                self.check(path, chunk_size=chunk_size)
+
+    def test_crlf(self):
+        content = self.read(self.write_ply('ascii')).replace(b'\n', b'\r\n')
+        self.check(self.write('crlf.ply', content), chunk_size=7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Checks of the binary .stl reader and writer against the ascii ones
+"""
+import struct
+import unittest
+
+import numpy as np
+
+from d3.model.formats.stl import STLParser, STLExporter, STL_RECORD, STL_HEADER_SIZE
+
+from helpers import ModelTestCase
+
+TRIANGLES = np.array([[[0, 0, 0], [1, 0, 0], [0, 1, 0]],
+                      [[1, 0, 0], [1, 1, 0], [0, 1, 0]],
+                      [[0, 0, 1], [0.5, 0.25, 1], [0.125, 1, 1]]], dtype='float32')
+
+def _binary(triangles, name = b''):
+    """Returns a binary .stl file of triangles, with a header beginning with name
+    """
+    records = np.zeros(len(triangles), dtype=STL_RECORD)
+    records['vertices'] = triangles
+    return name.ljust(80, b'\0') + struct.pack('<I', len(records)) + records.tobytes()
+
+def _ascii(triangles):
+    """Returns an ascii .stl file of triangles
+    """
+    lines = ['solid test']
+    for triangle in triangles.tolist():
+        lines += ['facet normal 0 0 1', 'outer loop']
+        lines += ['vertex {} {} {}'.format(*vertex) for vertex in triangle]
+        lines += ['endloop', 'endfacet']
+    return '\n'.join(lines + ['endsolid test']) + '\n'
+
+class STLTest(ModelTestCase):
+    def parse(self, path, memory_map = False):
+        model = STLParser()
+        model.memory_map = memory_map
+        model.parse_file(path)
+        return model
+
+    def test_binary(self):
+        model = self.parse(self.write('binary.stl', _binary(TRIANGLES)))
+        expected = self.parse(self.write('ascii.stl', _ascii(TRIANGLES)))
+
+        self.assertSameModel(model, expected)
+        np.testing.assert_array_equal(model.get_array('vertices'), TRIANGLES.reshape(-1, 3))
+
+    def test_binary_beginning_with_solid(self):
+        # Many binary files have a header beginning with solid, their size
+        # tells them apart from ascii files
+        model = self.parse(self.write('solid.stl', _binary(TRIANGLES, b'solid binary')))
+        np.testing.assert_array_equal(model.get_array('vertices'), TRIANGLES.reshape(-1, 3))
+
+    def test_memory_map(self):
+        model = self.parse(self.write('binary.stl', _binary(TRIANGLES)), memory_map=True)
+        np.testing.assert_array_equal(model.get_array('vertices'), TRIANGLES.reshape(-1, 3))
+        np.testing.assert_array_equal(model.get_index_array(), np.arange(9).reshape(-1, 3))
+
+    def test_truncated(self):
+        # The count of the header is larger than the triangles of the file
+        content = _binary(TRIANGLES)
+        model = self.parse(self.write('truncated.stl', content[:-10]))
+        np.testing.assert_array_equal(model.get_array('vertices'), TRIANGLES[:2].reshape(-1, 3))
+
+    def test_export(self):
+        model = self.parse(self.write('model.stl', _ascii(TRIANGLES)))
+
+        for format in ('ascii', 'binary'):
+            with self.subTest(format=format):
+                content = bytes(STLExporter(model, format))
+                self.assertEqual(content.startswith(b'solid'), format == 'ascii')
+
+                exported = self.parse(self.write(format + '.stl', content))
+                self.assertSameModel(exported, model)
+
+    def test_export_normals(self):
+        model = self.parse(self.write('model.stl', _ascii(TRIANGLES)))
+        records = np.frombuffer(bytes(STLExporter(model, 'binary')), STL_RECORD, offset=STL_HEADER_SIZE)
+
+        normals = np.cross(TRIANGLES[:, 1] - TRIANGLES[:, 0], TRIANGLES[:, 2] - TRIANGLES[:, 0])
+        normals /= np.linalg.norm(normals, axis=1)[:, np.newaxis]
+        np.testing.assert_allclose(records['normal'], normals, rtol=1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
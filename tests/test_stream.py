@@ -0,0 +1,123 @@
+"""Checks of the conversions piece by piece against the ones of whole models
+"""
+import io
+import itertools
+import unittest
+
+import d3.model.tools as mt
+from d3.model.formats.obj import OBJParser
+from d3.model.formats.ply import PLYExporter
+
+from helpers import ModelTestCase
+
+MTL = """newmtl red
+Kd 1 0 0
+"""
+
+def _obj(colored = True):
+    """Returns a .obj file with a material, vertices, with colors or not, and faces
+    """
+    lines = ['mtllib model.mtl']
+    lines += ['v {} {} {}'.format(i, i % 3, i % 5) + (' 0.5 0.25 1' if colored else '') for i in range(20)]
+    lines += ['usemtl red']
+    lines += ['f {} {} {}'.format(i + 1, i + 2, i + 3) for i in range(18)]
+    return '\n'.join(lines) + '\n'
+
+class _Pipe(io.BytesIO):
+    """File object that cannot seek, like the standard output
+    """
+    def seekable(self):
+        return False
+
+class StreamTest(ModelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write('model.mtl', MTL)
+
+    def stream(self, input, output, chunk_size, file = None, **options):
+        """Writes the pieces of chunk_size bytes of an .obj file like stream_model
+        """
+        pieces = OBJParser().stream_file(input, chunk_size)
+        first = next(pieces)
+        file = file if file is not None else io.BytesIO()
+        mt.export_model(first, output, **options).write_stream(itertools.chain([first], pieces), file)
+        return file.getvalue()
+
+    def assertSameFile(self, content, path):
+        """Checks that a converted file has the model of the whole input
+        """
+        expected = mt.load_model(self.write('expected' + mt.file_extension(path), content))
+        self.assertSameModel(mt.load_model(path), expected)
+
+    def test_convert(self):
+        # From obj to ply, ply to off and off to obj
+        input = self.write('model.obj', _obj())
+
+        for (input, output) in [('model.obj', 'model.ply'), ('model.ply', 'model.off'), ('model.off', 'model.obj')]:
+            with self.subTest(input=input, output=output):
+                mt.convert(self.path(input), self.path(output), stream=True)
+                self.assertSameFile(bytes(mt.export_model(mt.load_model(self.path(input)), output)),
+                                    self.path(output))
+
+    def test_pieces(self):
+        # The first pieces only have the mtllib line, or some vertices
+        input = self.write('model.obj', _obj())
+        expected = bytes(mt.export_model(mt.load_model(input), 'model.ply'))
+
+        for chunk_size in (13, 37, 100, 1 << 20):
+            for format in ('ascii', 'binary_little_endian'):
+                for file in (io.BytesIO(), _Pipe()):
+                    with self.subTest(chunk_size=chunk_size, format=format, file=file.__class__.__name__):
+                        content = self.stream(input, 'model.ply', chunk_size, file, format=format)
+                        self.assertSameFile(expected, self.write('streamed.ply', content))
+
+    def load(self, content):
+        """Parses a .obj file, used as a piece of a stream
+        """
+        model = OBJParser()
+        model.parse_file(self.write('piece.obj', content))
+        return model
+
+    def test_different_properties(self):
+        # Vertices with and without colors cannot be written in the same file
+        colored = self.load(_obj())
+        colorless = self.load(_obj(False))
+
+        for pieces in [(colorless, colored), (colored, colorless)]:
+            with self.assertRaisesRegex(Exception, 'same properties'):
+                PLYExporter(pieces[0]).write_stream(pieces, io.BytesIO())
+
+    def test_empty_first_piece(self):
+        # The properties are the ones of the first piece with vertices
+        empty = self.load('mtllib model.mtl\n')
+        colored = self.load(_obj())
+        file = io.BytesIO()
+        PLYExporter(empty).write_stream([empty, colored], file)
+
+        self.assertSameFile(bytes(PLYExporter(colored)), self.write('streamed.ply', file.getvalue()))
+
+    def test_options(self):
+        input = self.write('model.obj', _obj())
+        content = self.stream(input, 'model.ply', 37, colors=False)
+        self.assertEqual(mt.load_model(self.write('streamed.ply', content)).get_count('colors'), 0)
+
+        exporter = PLYExporter(OBJParser(), colors=False)
+        self.assertEqual(exporter.vertex_properties(mt.load_model(input)), (False, False, False))
+
+    def test_unsupported(self):
+        input = self.write('model.obj', _obj())
+
+        with self.assertRaises(Exception):
+            mt.convert(input, self.path('model.stl'), stream=True)
+
+        with self.assertRaises(Exception):
+            mt.convert(input, self.path('model.ply'), stream=True, weld=0.0)
+
+        # Texture coordinates are indexed in each piece of a .ply file
+        input = self.write('textured.obj', 'v 0 0 0\nv 1 0 0\nv 0 1 0\nvt 0 0\nf 1/1 2/1 3/1\n')
+
+        with self.assertRaises(Exception):
+            mt.convert(input, self.path('model.ply'), stream=True)
+
+if __name__ == '__main__':
+    unittest.main()
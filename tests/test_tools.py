@@ -0,0 +1,114 @@
+"""Checks of the registry of the formats and of their detection
+"""
+import struct
+import types
+import unittest
+
+import d3.model.tools as mt
+from d3.model.formats.obj import OBJParser, OBJExporter
+
+from helpers import ModelTestCase
+
+TRIANGLE = "v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n"
+
+class RegistryTestCase(ModelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.supported_formats = list(mt.supported_formats)
+        self.formats_by_extension = dict(mt.formats_by_extension)
+
+    def tearDown(self):
+        # The registry is global, the tests must leave it as they found it
+        mt.supported_formats[:] = self.supported_formats
+        mt.formats_by_extension.clear()
+        mt.formats_by_extension.update(self.formats_by_extension)
+        super().tearDown()
+
+class RegistryTest(RegistryTestCase):
+    def test_file_extension(self):
+        self.assertEqual(mt.file_extension('dir.v2/model.ply'), '.ply')
+        self.assertEqual(mt.file_extension('.ply'), '.ply')
+        self.assertEqual(mt.file_extension('dir.v2/model'), '')
+
+    def test_find_type(self):
+        for format in ('obj', 'off', 'ply', 'stl'):
+            self.assertEqual(mt.find_type('dir/model.' + format).typename, format)
+            self.assertEqual(mt.find_type('model.' + format, mt.supported_formats).typename, format)
+
+        self.assertIsNone(mt.find_type('model.xyz'))
+
+    def test_plugin(self):
+        # A module whose classes are named after the format
+        module = types.ModuleType('xyz')
+        module.XYZParser = OBJParser
+        module.XYZExporter = OBJExporter
+        mt.register_format('xyz', module, ['.xyz', '.XYZ'])
+
+        model = mt.load_model(self.write('model.xyz', TRIANGLE))
+        self.assertEqual(model.face_count(), 1)
+        self.assertEqual(mt.find_type('model.XYZ').typename, 'xyz')
+
+    def test_replace(self):
+        first = mt.register_format('aaa', 'aaa', ['.x', '.w'])
+        second = mt.register_format('aaa', 'aaa', ['.x', '.y'])
+
+        self.assertIs(mt.find_type('f.x'), second)
+        self.assertIsNone(mt.find_type('f.w'))
+        self.assertNotIn(first, mt.supported_formats)
+        self.assertEqual([type.typename for type in mt.supported_formats].count('aaa'), 1)
+
+    def test_replace_taken_extension(self):
+        # The extension taken by another format stays its own
+        mt.register_format('aaa', 'aaa', ['.x'])
+        other = mt.register_format('bbb', 'bbb', ['.x'])
+        mt.register_format('aaa', 'aaa', ['.y'])
+
+        self.assertIs(mt.find_type('f.x'), other)
+        self.assertEqual(mt.find_type('f.y').typename, 'aaa')
+
+        mt.register_format('bbb', 'bbb', ['.z'])
+        self.assertIsNone(mt.find_type('f.x'))
+
+class SniffTest(RegistryTestCase):
+    def assertSniffed(self, content, typename):
+        path = self.write('model.bin', content)
+        type = mt.find_type(path, sniff=True)
+        self.assertEqual(type.typename if type is not None else None, typename)
+
+    def test_ply(self):
+        self.assertSniffed('ply\nformat ascii 1.0\nelement vertex 0\nend_header\n', 'ply')
+        self.assertSniffed(b'ply\r\nformat binary_little_endian 1.0\r\nend_header\r\n', 'ply')
+
+    def test_off(self):
+        self.assertSniffed('OFF\n3 1 0\n0 0 0\n1 0 0\n0 1 0\n3 0 1 2\n', 'off')
+        self.assertSniffed('  COFF\n0 0 0\n', 'off')
+        self.assertSniffed('OFFSET 3\n', None)
+
+    def test_stl(self):
+        self.assertSniffed('solid model\nendsolid model\n', 'stl')
+
+        # A binary file is recognized from its size
+        header = b'\0' * 80 + struct.pack('<I', 2)
+        self.assertSniffed(header + b'\0' * 100, 'stl')
+        self.assertSniffed(header + b'\0' * 99, None)
+
+    def test_unknown(self):
+        self.assertSniffed(TRIANGLE, None)
+        self.assertSniffed(b'', None)
+
+    def test_sniff_only_unknown_extensions(self):
+        # The extension is trusted when it is known
+        path = self.write('model.obj', 'OFF\n0 0 0\n')
+        self.assertEqual(mt.find_type(path, sniff=True).typename, 'obj')
+        self.assertIsNone(mt.find_type(self.path('missing.bin'), sniff=True))
+
+    def test_load(self):
+        model = mt.load_model(self.write('model', 'OFF\n3 1 0\n0 0 0\n1 0 0\n0 1 0\n3 0 1 2\n'))
+        self.assertEqual(model.face_count(), 1)
+
+    def test_plugin(self):
+        mt.register_format('xyz', 'xyz', ['.xyz'], lambda header, size: header.startswith(b'XYZ'))
+        self.assertSniffed('XYZ\n', 'xyz')
+
+if __name__ == '__main__':
+    unittest.main()